@@ -0,0 +1,164 @@
+# =================================================================
+# Script name: export.py
+#
+# Description: stream result tables out to CSV and Parquet so they
+# can be read without arcpy
+# =================================================================
+# Note: Nothing in here uses arcpy - rows come in from any iterable (an
+# arcpy.da.SearchCursor in main.py), which allows testing without mocks
+
+import csv
+import logging
+import os
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+log = logging.getLogger(__name__)
+
+# Column types understood by the exporter
+COLUMN_TYPES = ('int', 'float', 'str', 'datetime', 'binary')
+
+# Parquet needs the optional pyarrow package; CSV always works
+DEFAULT_FORMATS = ('csv', 'parquet') if pyarrow is not None else ('csv',)
+
+
+def _csv_converter(column_type):
+    """Return a function that turns one value of ``column_type`` into CSV text."""
+    if column_type == 'datetime':
+        return lambda value: '' if value is None else value.isoformat()
+    if column_type == 'binary':
+        return lambda value: '' if value is None else bytes(value).hex()
+    return lambda value: '' if value is None else value
+
+
+def _parquet_type(column_type):
+    """Return the Parquet (Arrow) type a column type is stored as."""
+    return {'int': pyarrow.int64(),
+            'float': pyarrow.float64(),
+            'str': pyarrow.string(),
+            'datetime': pyarrow.timestamp('us'),
+            'binary': pyarrow.binary()}[column_type]
+
+
+def _parquet_column(values, column_type):
+    if column_type == 'binary':
+        values = [None if v is None else bytes(v) for v in values]
+    elif column_type == 'str':
+        # Text is also the fallback for field types with no column type of their
+        # own (e.g. arcpy DateOnly gives datetime.date), which Arrow won't take as a string
+        values = [None if v is None else str(v) for v in values]
+    return pyarrow.array(values, type=_parquet_type(column_type))
+
+
+def _chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _close(csv_file, parquet_writer):
+    if csv_file is not None:
+        csv_file.close()
+    if parquet_writer is not None:
+        parquet_writer.close()
+
+
+def export_table(rows, columns, out_base, formats=DEFAULT_FORMATS, chunk_size=50000):
+    """Write rows to CSV and/or Parquet in one pass, a chunk at a time.
+
+    Only ``chunk_size`` rows are held in memory at once, whatever the size of
+    the table. Each file is written under a temporary name and renamed when
+    complete, so readers never see a half-written export.
+
+    Example
+    -------
+    .. code-block:: python
+
+        # This code block commented because it is for example purposes only (should not be run)
+
+        # with arcpy.da.SearchCursor(roads_fc, ['ROAD_ID', 'SHAPE@WKB']) as cursor:
+        #     export_table(cursor, [('ROAD_ID', 'int'), ('geometry_wkb', 'binary')],
+        #                  os.path.join(export_folder, 'roads'))
+
+    Parameters
+    ----------
+    rows: iterable
+        Row tuples, in the same order as ``columns``
+    columns: list
+        (name, type) pairs; type is one of 'int', 'float', 'str', 'datetime', 'binary'
+    out_base: str
+        Full path of the output without extension (``.csv``/``.parquet`` are added)
+    formats: tuple, optional
+        Any of 'csv' and 'parquet'. Defaults to both if pyarrow is installed.
+    chunk_size: int, optional
+        Rows held in memory at once. Defaults to 50000.
+
+    Returns
+    -------
+    int
+        Number of rows written
+
+    Raises
+    ------
+    ValueError
+        If a column type or format is not recognised
+    ImportError
+        If Parquet is asked for but pyarrow is not installed
+    """
+    bad_types = [t for _, t in columns if t not in COLUMN_TYPES]
+    if bad_types:
+        raise ValueError("Unknown column type(s): {}".format(", ".join(bad_types)))
+    bad_formats = [f for f in formats if f not in ('csv', 'parquet')]
+    if bad_formats:
+        raise ValueError("Unknown export format(s): {}".format(", ".join(bad_formats)))
+    if 'parquet' in formats and pyarrow is None:
+        raise ImportError("Parquet export needs the pyarrow package")
+
+    names = [name for name, _ in columns]
+    types = [column_type for _, column_type in columns]
+    converters = [_csv_converter(t) for t in types]
+    csv_file = csv_writer = parquet_writer = None
+    count = 0
+    try:
+        if 'csv' in formats:
+            csv_file = open(out_base + '.csv.tmp', 'w', newline='')
+            csv_writer = csv.writer(csv_file)
+            csv_writer.writerow(names)
+        if 'parquet' in formats:
+            schema = pyarrow.schema([(n, _parquet_type(t)) for n, t in columns])
+            parquet_writer = pyarrow.parquet.ParquetWriter(out_base + '.parquet.tmp', schema)
+
+        for chunk in _chunks(rows, chunk_size):
+            # Work column by column - each converter is applied to a whole column at once
+            values = list(zip(*chunk))
+            if csv_writer is not None:
+                converted = [list(map(convert, column)) for convert, column in zip(converters, values)]
+                csv_writer.writerows(zip(*converted))
+            if parquet_writer is not None:
+                arrays = [_parquet_column(column, t) for column, t in zip(values, types)]
+                parquet_writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            count += len(chunk)
+    except Exception:
+        _close(csv_file, parquet_writer)
+        # Don't leave half-written files next to the exports
+        for fmt in formats:
+            try:
+                os.remove(out_base + '.{}.tmp'.format(fmt))
+            except OSError:
+                pass
+        raise
+    _close(csv_file, parquet_writer)
+
+    for fmt in formats:
+        os.replace(out_base + '.{}.tmp'.format(fmt), out_base + '.{}'.format(fmt))
+    log.debug("Exported {} rows to {} ({})".format(count, out_base, ", ".join(formats)))
+    return count
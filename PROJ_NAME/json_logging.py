@@ -0,0 +1,84 @@
+# =================================================================
+# Script name: json_logging.py
+#
+# Description: write log records as one JSON object per line, tagged
+# with the job and the step that wrote them
+# =================================================================
+
+import json
+import logging
+
+try:
+    import steps
+except ImportError:
+    from PROJ_NAME import steps
+
+
+class JobContextFilter(logging.Filter):
+    """Tag every log record with the job it belongs to and the step running.
+
+    Attach this to a job's log handler. Records get a ``job_id`` attribute, and
+    a ``step`` attribute taken from ``extra={'step': ...}`` if the caller gave
+    one, or else from the step running in the current thread (see
+    :func:`steps.current_step`).
+
+    Attributes
+    ----------
+    job_id: str
+        Job identifier, e.g. :attr:`main.SetUp.process_id`
+    """
+
+    def __init__(self, job_id):
+        """
+        Parameters
+        ----------
+        job_id: str
+            Job identifier
+        """
+        logging.Filter.__init__(self)
+        self.job_id = job_id
+
+    def filter(self, record):
+        record.job_id = self.job_id
+        if getattr(record, 'step', None) is None:
+            record.step = steps.current_step()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as one JSON object per line.
+
+    Each line has the keys time, level, logger, line, job_id, step and message
+    (plus exception, if there is one), so logs can be loaded without parsing
+    free text. Use together with :class:`JobContextFilter`.
+
+    Example
+    -------
+    .. code-block:: text
+
+        {"time": "10/01/2018 08:00:31", "level": "INFO", "logger": "PROJ_NAME.kitty_12",
+         "line": 210, "job_id": "kitty_12", "step": "roads",
+         "message": "Step roads finished in 30.00 s"}
+
+    """
+
+    def __init__(self, datefmt="%m/%d/%Y %H:%M:%S"):
+        """
+        Parameters
+        ----------
+        datefmt: str, optional
+            Timestamp format, the same as the text log format by default
+        """
+        logging.Formatter.__init__(self, datefmt=datefmt)
+
+    def format(self, record):
+        entry = {'time': self.formatTime(record, self.datefmt),
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'line': record.lineno,
+                 'job_id': getattr(record, 'job_id', None),
+                 'step': getattr(record, 'step', None),
+                 'message': record.getMessage()}
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
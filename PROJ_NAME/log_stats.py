@@ -0,0 +1,204 @@
+# =================================================================
+# Script name: log_stats.py
+#
+# Description: summarize step durations, error counts and run-to-run
+# trends across many PROJ_NAME_*.log files
+#
+# Usage: python log_stats.py <log folder> [output folder] [processes]
+# =================================================================
+
+import csv
+import glob
+import json
+import mmap
+import os
+import re
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# Matches the format set in main.SetUp.create_logger:
+# "%(asctime)s | %(name)s [Line %(lineno)d] | %(levelname)s: %(message)s"
+LINE_PATTERN = re.compile(rb'^(\d\d/\d\d/\d{4} \d\d:\d\d:\d\d) \| [^|\n]* \| ([A-Z]+): ([^\r\n]*)',
+                          re.MULTILINE)
+# Written by steps.StepGraph as each step finishes
+STEP_PATTERN = re.compile(r'^Step (.+) finished in ([\d.]+) s$')
+TIME_FORMAT = "%m/%d/%Y %H:%M:%S"
+
+
+def summarize_log(log_path):
+    """Pull run timings, error counts and step durations out of one log file.
+
+    The file is memory-mapped and scanned with a single regular expression, so
+    only the matching lines are ever turned into Python strings. Continuation
+    lines (e.g. tracebacks) are skipped. Logs written in the JSON format (see
+    :class:`json_logging.JsonFormatter`) are read line by line instead.
+
+    Parameters
+    ----------
+    log_path: str
+        Full path to a log file
+
+    Returns
+    -------
+    dict
+        'log', 'start', 'end', 'duration_s', 'errors', 'warnings' and 'steps'
+        (step name -> seconds). Times are None for an empty log.
+    """
+    run = {'log': os.path.basename(log_path), 'start': None, 'end': None, 'duration_s': None,
+           'errors': 0, 'warnings': 0, 'steps': OrderedDict()}
+    if os.path.getsize(log_path) == 0:
+        return run
+    with open(log_path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if data[:1] == b'{':
+                records = _json_records(data)
+            else:
+                records = (match.groups() for match in LINE_PATTERN.finditer(data))
+            first = last = None
+            for stamp, level, message in records:
+                if first is None:
+                    first = stamp
+                last = stamp
+                if level in (b'ERROR', b'CRITICAL'):
+                    run['errors'] += 1
+                elif level == b'WARNING':
+                    run['warnings'] += 1
+                elif message.startswith(b'Step '):
+                    step = STEP_PATTERN.match(message.decode('utf-8', 'replace'))
+                    if step:
+                        run['steps'][step.group(1)] = float(step.group(2))
+        finally:
+            data.close()
+    if first is not None:
+        run['start'] = datetime.strptime(first.decode('ascii'), TIME_FORMAT)
+        run['end'] = datetime.strptime(last.decode('ascii'), TIME_FORMAT)
+        run['duration_s'] = (run['end'] - run['start']).total_seconds()
+    return run
+
+
+def _json_records(data):
+    """Yield (time, level, message) as bytes from a JSON-lines log."""
+    for line in iter(data.readline, b''):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        yield (entry['time'].encode('ascii'), entry['level'].encode('ascii'),
+               entry['message'].encode('utf-8'))
+
+
+def summarize_logs(log_paths, processes=None):
+    """Summarize many log files, optionally in parallel.
+
+    Parameters
+    ----------
+    log_paths: list
+        Full paths to log files
+    processes: int, optional
+        Number of worker processes. Defaults to 1 (no extra processes);
+        pass 0 to use one per CPU.
+
+    Returns
+    -------
+    list
+        One :func:`summarize_log` dictionary per file, oldest run first
+    """
+    if processes == 1 or processes is None or len(log_paths) < 2:
+        runs = [summarize_log(p) for p in log_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=processes or None) as pool:
+            runs = list(pool.map(summarize_log, log_paths, chunksize=16))
+    return sorted(runs, key=lambda r: (r['start'] is None, r['start'] or datetime.min, r['log']))
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def step_trends(runs, recent=10):
+    """Build one summary row per step across all runs.
+
+    The trend compares the mean of the most recent ``recent`` runs of a step
+    with the mean of all the runs before them, as a percent change (positive
+    means the step is getting slower).
+
+    Parameters
+    ----------
+    runs: list
+        Output of :func:`summarize_logs`, oldest first
+    recent: int, optional
+        How many of the latest runs count as recent. Defaults to 10.
+
+    Returns
+    -------
+    list
+        Dictionaries with 'step', 'runs', 'mean_s', 'median_s', 'max_s',
+        'last_s' and 'trend_pct' (None if there are too few runs), slowest
+        median first
+    """
+    durations = OrderedDict()
+    for run in runs:
+        for step, seconds in run['steps'].items():
+            durations.setdefault(step, []).append(seconds)
+    rows = []
+    for step, values in durations.items():
+        trend = None
+        if len(values) > recent:
+            before = sum(values[:-recent]) / len(values[:-recent])
+            after = sum(values[-recent:]) / recent
+            if before:
+                trend = round((after - before) / before * 100, 1)
+        rows.append(OrderedDict([('step', step),
+                                 ('runs', len(values)),
+                                 ('mean_s', round(sum(values) / len(values), 2)),
+                                 ('median_s', round(_median(values), 2)),
+                                 ('max_s', max(values)),
+                                 ('last_s', values[-1]),
+                                 ('trend_pct', trend)]))
+    return sorted(rows, key=lambda r: r['median_s'], reverse=True)
+
+
+def write_csv(rows, out_path):
+    """Write a list of dictionaries to CSV (the keys of the first row are the header).
+
+    Parameters
+    ----------
+    rows: list
+        Dictionaries with the same keys
+    out_path: str
+        Full path to the CSV file
+
+    Returns
+    -------
+    None
+    """
+    with open(out_path, 'w', newline='') as f:
+        if not rows:
+            return
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(args):
+    log_folder = args[0]
+    out_folder = args[1] if len(args) > 1 else log_folder
+    processes = int(args[2]) if len(args) > 2 else 0
+    runs = summarize_logs(glob.glob(os.path.join(log_folder, "PROJ_NAME_*.log")), processes)
+    run_rows = [OrderedDict([('log', r['log']), ('start', r['start']), ('duration_s', r['duration_s']),
+                             ('errors', r['errors']), ('warnings', r['warnings']),
+                             ('steps', len(r['steps']))]) for r in runs]
+    write_csv(run_rows, os.path.join(out_folder, "log_runs.csv"))
+    write_csv(step_trends(runs), os.path.join(out_folder, "log_steps.csv"))
+    print("Summarized {} logs to {}".format(len(runs), out_folder))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -4,22 +4,59 @@
 # Description: the main script for running PROJ_NAME
 # =================================================================
 
+import hashlib
 import logging
+import multiprocessing
 import os
 import sys
 import time
 import re
+import shutil
+import sqlite3
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import arcpy
 
+import export
 import util
+import worker
 from arcpy_logging import ArcpyLog
+from json_logging import JobContextFilter, JsonFormatter
+from progress import ProgressReporter
+from result_cache import ResultCache, cache_key
+from steps import CheckpointLog, FingerprintStore, StepGraph
+from workspace_pool import shared_pool
 
 
 EMAIL_SENDER = 'orapipe@dnr.wa.gov' # use for Appworx
 ADMIN_EMAIL = ['Hilary.Browning@dnr.wa.gov', 'Kristin.Jamison@dnr.wa.gov']
 # ADMIN_EMAIL = ['Kristin.Jamison@dnr.wa.gov'] # kj testing
 mail_server = os.getenv("MAILRELAY")
+# 'text' (default) or 'json' - one JSON object per log line, with job_id and step
+LOG_FORMAT = os.getenv("PROJ_NAME_LOG_FORMAT", "text")
+# Export the finished gdb's attribute tables to CSV/Parquet ('false' to skip)
+EXPORT_TABLES = os.getenv("PROJ_NAME_EXPORT_TABLES", "true").lower() != "false"
+
+# Analysis steps running at once (each in its own process)
+ANALYSIS_WORKERS = 4
+
+# Finished results of identical requests are reused for this long (seconds)
+RESULT_CACHE_TTL = 7 * 24 * 3600
+RESULT_CACHE_MAX_ENTRIES = 50
+# Request parameters that say which sale area a job is for - results are only
+# reused for requests that have all of them (see result_cache.cache_key)
+RESULT_CACHE_KEY_PARAMS = ('sale_name',)
+
+# arcpy field type -> export.export_table column type (anything else is exported as text)
+EXPORT_FIELD_TYPES = {'OID': 'int',
+                      'SmallInteger': 'int',
+                      'Integer': 'int',
+                      'BigInteger': 'int',
+                      'Single': 'float',
+                      'Double': 'float',
+                      'Date': 'datetime'}
 
 
 class SetUp(object):
@@ -68,14 +105,23 @@ class SetUp(object):
     date_time_stamp: str
         Date & time string-formatted to: '%m-%d-%H%M'
     log: logging object
-        Module level logging instance
+        Logging instance for this job only
+    log_path: str
+        Path to this job's log file
     process_path: str
         Full path to the folder where processing occurs
     gdb_full_path: str
         Full path to geodatabase where outputs saved
+
+    Notes
+    -----
+    Only absolute paths are used (no ``os.chdir``) and each job logs through
+    its own logger and file handler, so several jobs can be set up at once in
+    different threads of the same process. Call :meth:`close` when the job is
+    finished to release the log file.
     """
 
-    def __init__(self, log_level, proc_id, email, gdb_name):
+    def __init__(self, log_level, proc_id, email, gdb_name, log_format=LOG_FORMAT):
         """
         Parameters
         ----------
@@ -85,6 +131,8 @@ class SetUp(object):
             Process ID from batch processer
         gdb_name: str
             Geodatabase name to create/write to
+        log_format: str, optional
+            'text' or 'json'. Defaults to the PROJ_NAME_LOG_FORMAT env variable, or 'text'.
         """
         print("Setting system variables")
 
@@ -102,6 +150,7 @@ class SetUp(object):
         # self.ropa_instance = 'ropa_sde_instance'  # os.getenv("ROPA_SDE_INSTANCE")
         # self.connect_home = os.path.join(self.proc_drive, "sde_connections")
         # self.log_home = 'logs' #os.path.join(self.data_home, "manage\\logs")
+        self.log_home = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
 
         # Inputs
         self.date_time_stamp = time.strftime('%m%d%Y_%H%M')
@@ -111,33 +160,42 @@ class SetUp(object):
         self.process_id = "{}_{}".format(self.recipient_id, proc_id)
 
         # Run set up methods
-        self.log, self.log_path = self.create_logger(self.log_level)
+        self.log, self.log_path = self.create_logger(self.log_level, log_format)
         self.check_work_folder_exists()
         self.process_path = self.create_process_folder()
         self.gdb_full_path = self.create_gdb()
 
-    def create_logger(self, log_level):
-        """Create a logging instance at log home with date stamp.
+    def create_logger(self, log_level, log_format="text"):
+        """Create a logger for this job, writing to a date-stamped file at log home.
+
+        Each job gets its own logger (named after the process_id) with its own
+        file handler. It does not propagate to the root logger, so messages from
+        jobs running side by side never end up in each other's log files. This
+        logger is what is passed around inside the rest of the module (including
+        what is passed into, and then out of, ArcpyLog).
 
-        This logger is the parent of what is being passed around inside the rest of
-        the module (including what is passed into, and then out of, ArcpyLog) and it is
-        what is passed to getlogger in the sub-modules.
+        Every record is tagged with the job's process_id and the running step
+        (see :class:`json_logging.JobContextFilter`); the 'json' format writes
+        those out as fields of one JSON object per line.
 
         Parameters
         ----------
         log_level: str
             Logging severity conformant to standard logging
+        log_format: str, optional
+            'text' (default) or 'json'
 
         Returns
         -------
         logging object
-            Module level logging instance
+            Logging instance for this job
         log_path str
             Path to log file on disk
 
         """
         # kj - file_name = "log_{}.log".format(self.date_time_stamp)
-        file_name = "PROJ_NAME_{}.log".format(self.date_time_stamp)
+        file_name = "PROJ_NAME_{}_{}.log".format(self.date_time_stamp, self.process_id)
+        self.make_folder(self.log_home)
         log_path = os.path.join(self.log_home, file_name)
         level = log_level.upper()
         switcher = {"DEBUG": logging.DEBUG,
@@ -145,13 +203,61 @@ class SetUp(object):
                     "WARNING": logging.WARNING,
                     "ERROR": logging.ERROR,
                     "CRITICAL": logging.CRITICAL}
-        logging.basicConfig(filename=log_path,
-                            format="%(asctime)s | %(name)s [Line %(lineno)d] | %(levelname)s: %(message)s",
-                            datefmt="%m/%d/%Y %H:%M:%S",
-                            level=switcher[level])
-        logger = logging.getLogger("root")
+        handler = logging.FileHandler(log_path)
+        handler.addFilter(JobContextFilter(self.process_id))
+        if log_format.lower() == "json":
+            handler.setFormatter(JsonFormatter(datefmt="%m/%d/%Y %H:%M:%S"))
+        else:
+            handler.setFormatter(logging.Formatter(
+                fmt="%(asctime)s | %(name)s [Line %(lineno)d] | %(levelname)s: %(message)s",
+                datefmt="%m/%d/%Y %H:%M:%S"))
+        logger = logging.getLogger("PROJ_NAME.{}".format(self.process_id))
+        logger.setLevel(switcher[level])
+        logger.propagate = False
+        # A re-run of the same process_id in this interpreter must not log twice
+        for old_handler in list(logger.handlers):
+            logger.removeHandler(old_handler)
+            old_handler.close()
+        logger.addHandler(handler)
         return logger, os.path.abspath(log_path)
 
+    def close(self):
+        """Close this job's log handler(s).
+
+        Returns
+        -------
+        None
+        """
+        for handler in list(self.log.handlers):
+            self.log.removeHandler(handler)
+            handler.close()
+
+    @staticmethod
+    def make_folder(path):
+        """Create a folder (and any parents) if it does not exist.
+
+        ``os.makedirs`` either creates the folder or fails because it already
+        exists, in one call, so two jobs racing to create the same folder are
+        both fine.
+
+        Parameters
+        ----------
+        path: str
+            Full path of the folder
+
+        Returns
+        -------
+        bool
+            True if the folder was created by this call
+        """
+        try:
+            os.makedirs(path)
+        except FileExistsError:
+            return False
+        # Note: The syntax of 0o777 is for Python 2.6 and 3+.
+        os.chmod(path, 0o777)
+        return True
+
     def check_work_folder_exists(self):
         """Creates folder at :code:`//DNR/REGIONS/TEMP/PROJ_NAME` if it does not exist.
 
@@ -159,13 +265,9 @@ class SetUp(object):
         -------
         None
         """
-        os.chdir(self.workspace)
-        try:
-            os.mkdir(self.folder_name)
+        if self.make_folder(self.work_folder):
             self.log.info("Made new work folder at: {}".format(self.work_folder))
-            # Note: The syntax of 0o777 is for Python 2.6 and 3+.
-            os.chmod(self.folder_name, 0o777)
-        except WindowsError:
+        else:
             self.log.info("Work folder exists at: {}".format(self.work_folder))
 
     def create_process_folder(self):
@@ -176,13 +278,9 @@ class SetUp(object):
         str
             Full path to the folder where processing occurs
         """
-        os.chdir(self.work_folder)
         full_path = os.path.join(self.work_folder, self.process_id)
-        if not os.path.exists(self.process_id):
-            os.mkdir(self.process_id)
+        if self.make_folder(full_path):
             self.log.info("Made new processing folder at: {}".format(full_path))
-            # Note: The syntax of 0o777 is for Python 2.6 and 3+.
-            os.chmod(self.process_id, 0o777)
         else:
             self.log.info("Pre-existing processing folder found at: {}".format(full_path))
         return full_path
@@ -196,7 +294,6 @@ class SetUp(object):
             Full path to geodatabase where outputs will be saved
 
         """
-        arcpy.env.workspace = self.work_folder
         checklist_gdb = os.path.join(self.process_path, self.gdb_name) + ".gdb"
         if arcpy.Exists(checklist_gdb):
             self.log.info("Pre-existing gdb folder found at: {}".format(checklist_gdb))
@@ -266,7 +363,126 @@ def arcpy_defaults(log=None):
         log.info("Arcpy defaults set")
 
 
-def read_in_clip(in_fc, out_fc, ropa_path, where_clause="", intersect_lyr=None, clip_fc=None):
+def source_state(in_fc):
+    """Describe the current state of a source feature class or table.
+
+    Used to fingerprint steps (see :class:`steps.StepGraph`) so that a step
+    reruns when its source data changes. The row count and extent catch added,
+    deleted and moved features. Attribute edits don't change either, so:
+
+        - if editor tracking is on, the latest edit date is added (one
+          sorted query, cheap), otherwise
+        - a hash of every row's attributes is added (geometry is not read, but
+          this does read every row - the price of not missing an edit)
+
+    :class:`steps.StepGraph` works this out once per source per job, in the
+    step processes side by side, and reuses it for every step reading the
+    source and for the result cache key.
+
+    Parameters
+    ----------
+    in_fc: str
+        Full path to a feature class or table
+
+    Returns
+    -------
+    list or None
+        [row count, extent, last edit date or attribute hash], or None if the
+        data does not exist
+    """
+    if not arcpy.Exists(in_fc):
+        return None
+    desc = arcpy.Describe(in_fc)
+    extent = getattr(desc, 'extent', None)
+    state = [int(arcpy.GetCount_management(in_fc)[0]), str(extent) if extent else None]
+    edited_field = getattr(desc, 'editedAtFieldName', None)
+    if getattr(desc, 'editorTrackingEnabled', False) and edited_field:
+        sql_clause = (None, "ORDER BY {} DESC".format(edited_field))
+        with arcpy.da.SearchCursor(in_fc, [edited_field], sql_clause=sql_clause) as cursor:
+            latest = next(cursor, [None])[0]
+        state.append(str(latest) if latest else None)
+    else:
+        fields = [f.name for f in arcpy.ListFields(in_fc)
+                  if f.type not in ('Geometry', 'Blob', 'Raster')]
+        # Sorted (on the ObjectID, listed first) so the hash doesn't depend on read order
+        sql_clause = (None, "ORDER BY {}".format(fields[0]))
+        digest = hashlib.sha1()
+        with arcpy.da.SearchCursor(in_fc, fields, sql_clause=sql_clause) as cursor:
+            for row in cursor:
+                digest.update(repr(row).encode('utf-8'))
+        state.append(digest.hexdigest())
+    return state
+
+
+class RopaWorkspace(object):
+    """Open handle on a ROPA (SDE) workspace, kept in :data:`ROPA_POOL`.
+
+    Each feature class read through the handle gets a feature layer made on it
+    once. arcpy keeps the layer's workspace connection open for as long as the
+    layer exists, and layers made from it (see :func:`read_in_clip`) read
+    through that same connection - so holding this handle in the pool saves
+    reconnecting to ROPA for every extraction.
+
+    Layer names are global to the process, so a handle must be used by one
+    thread at a time (which the pool sees to).
+
+    Attributes
+    ----------
+    ropa_path: str
+        ROPA base path (SDE connection file)
+    """
+
+    def __init__(self, ropa_path):
+        """
+        Parameters
+        ----------
+        ropa_path: str
+            ROPA base path (SDE connection file)
+        """
+        self.ropa_path = ropa_path
+        self._layers = {}
+
+    def layer(self, in_fc):
+        """Return the open feature layer on a feature class in this workspace.
+
+        Parameters
+        ----------
+        in_fc: str
+            Feature class name, e.g. :code:`'ROPA.ROADS'`
+
+        Returns
+        -------
+        str
+            Layer name
+        """
+        try:
+            return self._layers[in_fc]
+        except KeyError:
+            layer = 'ropa_{}'.format(uuid.uuid4().hex[:10])
+            arcpy.MakeFeatureLayer_management(os.path.join(self.ropa_path, in_fc), layer)
+            self._layers[in_fc] = layer
+            return layer
+
+    def is_alive(self):
+        """Return True if the workspace and every open layer can still be reached."""
+        return arcpy.Exists(self.ropa_path) and all(arcpy.Exists(layer)
+                                                    for layer in self._layers.values())
+
+    def close(self):
+        """Delete the open layers, which lets arcpy drop the connection."""
+        for layer in self._layers.values():
+            arcpy.Delete_management(layer)
+        self._layers = {}
+
+
+# One pool per process, shared by every job and step the process runs. It is
+# passed to steps by name, so steps run in other processes use that process's pool
+ROPA_POOL = shared_pool('ropa', RopaWorkspace, closer=RopaWorkspace.close,
+                        health_check=RopaWorkspace.is_alive, max_idle=1800, check_after=300)
+
+
+def read_in_clip(in_fc, out_fc, ropa_path, where_clause="", intersect_lyr=None, clip_fc=None,
+                 pool=None):
     """Read in ROPA data and constrain it by a clip, query, and/or intersection.
 
     Make a clipped ArcGIS feature class from ROPA based upon:
@@ -289,49 +505,452 @@ def read_in_clip(in_fc, out_fc, ropa_path, where_clause="", intersect_lyr=None,
     where_clause: str, optional
         SQL query
     intersect_lyr: str, optional
-        Feature layer with which to intersect the input
+        Feature class or layer with which to intersect the input (a layer
+        must have been made in the process running the step)
     clip_fc: str, optional
         Feature class with which to clip the input
+    pool: workspace_pool.WorkspacePool, optional
+        Pool of open ROPA workspaces (e.g. :data:`ROPA_POOL`) to read through.
+        The workspace is held for the whole extraction.
+
+    Returns
+    -------
+    dict or None
+        Writes to disk (side effect). With a pool, returns how this extraction
+        used it (see :meth:`workspace_pool.WorkspacePool.usage_since`).
+
+    """
+    if pool is None:
+        _clip(os.path.join(ropa_path, in_fc), out_fc, where_clause, intersect_lyr, clip_fc)
+        return None
+    before = pool.stats()
+    with pool.connection(ropa_path) as workspace:
+        _clip(workspace.layer(in_fc), out_fc, where_clause, intersect_lyr, clip_fc)
+    return pool.usage_since(before)
+
+
+def _clip(source, out_fc, where_clause, intersect_lyr, clip_fc):
+    """Copy a query/selection/clip of ``source`` (a feature class or layer) to ``out_fc``."""
+    # Layer names are global to the process - keep them unique so concurrent jobs don't collide
+    fl = 'fl_{}'.format(uuid.uuid4().hex[:10])
+    arcpy.MakeFeatureLayer_management(source, fl, where_clause)
+    try:
+        if intersect_lyr:
+            arcpy.SelectLayerByLocation_management(fl, 'INTERSECT', intersect_lyr)
+
+        if clip_fc:
+            arcpy.Clip_analysis(fl, clip_fc, out_fc)
+        else:
+            arcpy.CopyFeatures_management(fl, out_fc)
+    finally:
+        arcpy.Delete_management(fl)
+
+
+def add_extraction(analysis, name, in_fc, out_fc, ropa_path, **kwargs):
+    """Declare a :func:`read_in_clip` step that reads through :data:`ROPA_POOL`.
+
+    The ROPA feature class is declared as the step's input, so the step is
+    fingerprinted on its source state, and the pool is left out of the hash.
+
+    Parameters
+    ----------
+    analysis: steps.StepGraph
+        Graph to add the step to
+    name: str
+        Step name
+    in_fc: str
+        Feature class name in corporate, e.g. :code:`'ROPA.ROADS'`
+    out_fc: str
+        Full path name where output should be saved
+    ropa_path: str
+        ROPA base path
+    kwargs:
+        Other :func:`read_in_clip` arguments (where_clause, intersect_lyr, clip_fc)
+
+    Returns
+    -------
+    steps.Step
+    """
+    inputs = [os.path.join(ropa_path, in_fc)] + [kwargs[k] for k in ('intersect_lyr', 'clip_fc')
+                                                  if kwargs.get(k)]
+    return analysis.add(name, read_in_clip, inputs=inputs, outputs=[out_fc], unhashed=['pool'],
+                        in_fc=in_fc, out_fc=out_fc, ropa_path=ropa_path, pool=ROPA_POOL, **kwargs)
+
+
+def pool_usage(analysis):
+    """Add up how a job's extraction steps used the ROPA pool.
+
+    :meth:`workspace_pool.WorkspacePool.stats` can't be used for this: the
+    pool is shared by every job in the process, and steps run in other
+    processes with pools of their own.
+
+    Parameters
+    ----------
+    analysis: steps.StepGraph
+        Graph that has been run
+
+    Returns
+    -------
+    dict
+        'hits', 'misses' and 'failed_checks' over the steps that ran
+    """
+    usage = {'hits': 0, 'misses': 0, 'failed_checks': 0}
+    for step in analysis.steps:
+        if step.func is read_in_clip and step.result:
+            for counter, count in step.result.items():
+                usage[counter] += count
+    return usage
+
+
+def export_outputs(gdb_path, out_folder, include_geometry=False, formats=export.DEFAULT_FORMATS,
+                   chunk_size=50000, log=None):
+    """Export every table and feature class in a gdb to CSV and/or Parquet.
+
+    Attribute tables are streamed out with a search cursor, ``chunk_size`` rows
+    at a time (see :func:`export.export_table`), one file per format per table.
+
+    Parameters
+    ----------
+    gdb_path: str
+        Full path to the geodatabase
+    out_folder: str
+        Folder the exports are written to (created if it does not exist)
+    include_geometry: bool, optional
+        Add a 'geometry_wkb' column holding each feature's geometry as WKB
+    formats: tuple, optional
+        Any of 'csv' and 'parquet'. Defaults to both if pyarrow is installed.
+    chunk_size: int, optional
+        Rows held in memory at once. Defaults to 50000.
+    log: logging object, optional
+        module-level logger
+
+    Returns
+    -------
+    dict
+        Table name -> number of rows exported
+    """
+    SetUp.make_folder(out_folder)
+    counts = {}
+    for dirpath, _, names in arcpy.da.Walk(gdb_path, datatype=['FeatureClass', 'Table']):
+        for name in names:
+            table = os.path.join(dirpath, name)
+            fields = [f for f in arcpy.ListFields(table)
+                      if f.type not in ('Geometry', 'Blob', 'Raster')]
+            cursor_fields = [f.name for f in fields]
+            columns = [(f.name, EXPORT_FIELD_TYPES.get(f.type, 'str')) for f in fields]
+            if include_geometry and arcpy.Describe(table).dataType == 'FeatureClass':
+                cursor_fields.append('SHAPE@WKB')
+                columns.append(('geometry_wkb', 'binary'))
+            with arcpy.da.SearchCursor(table, cursor_fields) as cursor:
+                counts[name] = export.export_table(cursor, columns, os.path.join(out_folder, name),
+                                                   formats=formats, chunk_size=chunk_size)
+            if log:
+                log.info("Exported {} rows from {} to {}".format(counts[name], name, out_folder))
+    return counts
+
+
+def write_report(table, renderer, out_path, output='text', where_clause=None):
+    """Write a report of a result table, streaming rows from a search cursor.
+
+    Parameters
+    ----------
+    table: str
+        Full path to a table or feature class
+    renderer: report.ReportRenderer
+        Renderer whose columns are fields of ``table``
+    out_path: str
+        Full path of the report file
+    output: str, optional
+        'text', 'html' or 'csv'. Defaults to 'text'.
+    where_clause: str, optional
+        SQL query
+
+    Returns
+    -------
+    int
+        Number of rows written
+    """
+    with arcpy.da.SearchCursor(table, renderer.columns, where_clause) as cursor:
+        with open(out_path, 'w', newline='') as f:
+            return renderer.render(cursor, f, output=output)
+
+
+def send_results(mem, email):
+    """Email the user that their checklist is ready.
+
+    Nothing is sent if no mail server is set or the email address could not
+    be parsed (see :meth:`SetUp.parse_email_address`).
+
+    Parameters
+    ----------
+    mem: SetUp
+        The job's set up object
+    email: str
+        User-input email address
 
     Returns
     -------
     None
-        Writes to disk (side effect)
+    """
+    if not (mail_server and mem.recipient_id):
+        mem.log.warning("Not emailing results (no mail server or email address)")
+        return
+    util.send_mail(mail_server, EMAIL_SENDER, [email],
+                   "PROJ_NAME checklist: {}".format(mem.gdb_name),
+                   "Your checklist is ready at:\n{}".format(mem.process_path))
+    mem.log.info("Emailed results to: {}".format(email))
+
+
+def restore_cached_results(mem, key):
+    """Copy the results of an identical earlier request into the job's folders.
+
+    The cache is only a shortcut: if it can't be read (e.g. the disk is full,
+    or another worker evicts the entry mid-copy) a warning is logged, anything
+    half-copied is cleared away, and the job runs as normal.
 
+    Parameters
+    ----------
+    mem: SetUp
+        The job's set up object
+    key: str
+        Output of :func:`result_cache.cache_key` (None to not use the cache)
+
+    Returns
+    -------
+    bool
+        True if cached results were copied in
     """
-    in_fc = os.path.join(ropa_path, in_fc)
-    arcpy.MakeFeatureLayer_management(in_fc, 'fl', where_clause)
-    if intersect_lyr:
-        arcpy.SelectLayerByLocation_management('fl', 'INTERSECT', intersect_lyr)
+    if key is None:
+        return False
+    try:
+        cache = ResultCache(os.path.join(mem.work_folder, "result_cache"),
+                            ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_MAX_ENTRIES)
+        return cache.restore(key, mem.process_path)
+    except (OSError, sqlite3.Error) as e:
+        mem.log.warning("Could not reuse cached results ({}) - running the analysis".format(e))
+        shutil.rmtree(os.path.join(mem.process_path, "exports"), ignore_errors=True)
+        shutil.rmtree(mem.gdb_full_path, ignore_errors=True)
+        mem.gdb_full_path = mem.create_gdb()
+        return False
 
-    if clip_fc:
-        arcpy.Clip_analysis('fl', clip_fc, out_fc)
-    else:
-        arcpy.CopyFeatures_management('fl', out_fc)
 
+def cache_results(mem, key):
+    """Keep a finished job's gdb and exports for identical later requests.
 
-def main(args):
+    A failure to cache is logged and otherwise ignored - the job itself has
+    finished.
+
+    Parameters
+    ----------
+    mem: SetUp
+        The job's set up object
+    key: str
+        Output of :func:`result_cache.cache_key` (None to not use the cache)
 
+    Returns
+    -------
+    None
+    """
+    if key is None:
+        return
     try:
-        # debugging = args[5]  # 'False'
-        debugging = 'False'
+        cache = ResultCache(os.path.join(mem.work_folder, "result_cache"),
+                            ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_MAX_ENTRIES)
+        cache.put(key, mem.process_path, [os.path.basename(mem.gdb_full_path), "exports"])
+    except (OSError, sqlite3.Error) as e:
+        mem.log.warning("Could not cache results ({})".format(e))
 
-        # Set up folders and loggers
 
-        # Check out standard arcpy things
-        # arcpy_defaults(log=log)
+def run_job(request, export_tables=EXPORT_TABLES, executor=None, rows_queue=None):
+    """Run one checklist job from start to finish.
+
+    Everything a job needs is built fresh from ``request`` (folders, logger,
+    gdb), so this can be called over and over from the same interpreter by
+    :class:`worker.Worker`. If an identical request (same gdb name, parameters
+    and source data, whoever sent it) finished recently, its outputs are
+    copied in from the result cache and the analysis is skipped. Requests
+    without the parameters in :data:`RESULT_CACHE_KEY_PARAMS` always run.
+
+    Parameters
+    ----------
+    request: worker.JobRequest
+        Job parameters
+    export_tables: bool, optional
+        Export the gdb's attribute tables (see :func:`export_outputs`).
+        Defaults to :data:`EXPORT_TABLES`.
+    executor: concurrent.futures.ProcessPoolExecutor, optional
+        Processes to run the analysis steps (and source state reads) in, kept
+        running between jobs (see :func:`run_worker`). Defaults to new
+        processes for this job only.
+    rows_queue: queue, optional
+        ``multiprocessing.Manager().Queue()`` the steps send row counts back
+        on (see :func:`steps.count_rows`), kept between jobs. Defaults to a
+        new manager for this job only.
 
+    Returns
+    -------
+    SetUp
+        The job's set up object
+    """
+    # Set up folders and loggers
+    mem = SetUp(request.log_level, request.proc_id, request.email, request.gdb_name)
+    # Operators can watch this file for the current step, rows/s and time remaining
+    status = ProgressReporter(os.path.join(mem.process_path, "status.json"), job_id=mem.process_id)
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS, initializer=arcpy_defaults)
+    try:
         # After creating this 'arcpy logger' you can run alog.log() to
         # get any arcpy messages you want
-        # alog = ArcpyLog(log, mem.log_level)
+        alog = ArcpyLog(mem.log, mem.log_level)
 
         # Set data sources here
 
+        # Declare the analyses..
+        # Declare each step with what it reads and writes (see steps.StepGraph);
+        # steps that don't depend on each other run at the same time, steps
+        # unchanged since the last run in this process folder are skipped, and
+        # a resumed job skips every step the failed run already finished
+        fingerprints = FingerprintStore(os.path.join(mem.process_path, "step_fingerprints.json"))
+        checkpoint = CheckpointLog(os.path.join(mem.process_path, "checkpoints.jsonl"))
+        analysis = StepGraph(log=mem.log, store=fingerprints, source_state=source_state,
+                             exists=arcpy.Exists, checkpoint=checkpoint, progress=status)
+        # ROPA layers are read through the pooled workspace, e.g.:
+        # add_extraction(analysis, 'roads', 'ROPA.ROADS', roads_fc, ropa_path, clip_fc=sale_fc)
+
+        # Reuse the results of an identical earlier request, if there is one.
+        # Requests without parameters (e.g. from the command line) get no key
+        # and always run. The source states are worked out once here (in the
+        # step processes) and reused for the step fingerprints.
+        key = None
+        if request.params and not request.resume:
+            key = cache_key(request.gdb_name, request.params,
+                            analysis.source_states(executor=executor),
+                            required=RESULT_CACHE_KEY_PARAMS)
+        if restore_cached_results(mem, key):
+            mem.log.info("Reused results of an identical earlier request "
+                         "(cache key {})".format(key))
+            send_results(mem, request.email)
+            status.finish()
+            return mem
+
         # Actually run the analyses..
+        if request.resume:
+            mem.log.info("Resuming from checkpoints in: {}".format(checkpoint.path))
+        # arcpy keeps its environment and scratch state per process and is not
+        # safe to call from several threads at once, so steps run in processes
+        analysis.run(resume=request.resume, executor=executor, rows_queue=rows_queue)
+
+        # Attribute tables for downstream users who don't have arcpy
+        if export_tables:
+            export_outputs(mem.gdb_full_path, os.path.join(mem.process_path, "exports"),
+                           log=mem.log)
+            # A cached entry must hold everything a full run would have made
+            cache_results(mem, key)
+        send_results(mem, request.email)
+        mem.log.info("ROPA workspace pool: {}".format(pool_usage(analysis)))
+        status.finish()
+
+    except Exception:
+        mem.log.exception("Fatal error in job {}: ".format(mem.process_id))
+        status.finish('failed')
+        raise
+    finally:
+        if own_executor:
+            executor.shutdown()
+        mem.close()
+    return mem
+
+
+def run_worker(queue_location, concurrency=1):
+    """Run jobs from a queue until stopped, keeping arcpy warm between jobs.
+
+    Parameters
+    ----------
+    queue_location: str
+        Queue folder, or SQLite database (``*.db``)
+    concurrency: int, optional
+        Number of jobs to run at once. Only 1 is supported for now (see Notes).
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ValueError
+        If ``concurrency`` is more than 1
+
+    Notes
+    -----
+    Jobs run on worker threads, and each job calls arcpy from its thread
+    (creating the gdb, reading source states, exporting tables). arcpy is not
+    safe to call from several threads at once, so jobs are run one at a time;
+    the analysis steps within a job still run side by side in processes.
+    """
+    concurrency = int(concurrency)
+    if concurrency > 1:
+        raise ValueError("Worker concurrency above 1 is not supported: jobs call arcpy from "
+                         "their own thread, and arcpy is not thread-safe")
+    # arcpy is already imported; the environment settings only need doing once
+    arcpy_defaults()
+    # Step processes are started (importing arcpy, checking out a license) once
+    # per worker, and their ROPA_POOL connections are reused from job to job
+    executor = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS, initializer=arcpy_defaults)
+    # Carries row counts from the step processes to each job's status file
+    manager = multiprocessing.Manager()
+    job_worker = worker.Worker(worker.open_queue(queue_location),
+                               partial(run_job, executor=executor, rows_queue=manager.Queue()),
+                               concurrency=concurrency)
+    try:
+        job_worker.run()
+    except KeyboardInterrupt:
+        job_worker.stop()
+    finally:
+        # The step processes' pools close with the processes
+        executor.shutdown()
+        manager.shutdown()
+        ROPA_POOL.close()
+
+
+def main(args):
+    """Run a single job, or start worker mode.
+
+    Parameters
+    ----------
+    args: list
+        Either ``[log_level, proc_id, email, gdb_name]`` for a single job (add
+        ``'resume'`` as a fifth argument to continue a failed job), or
+        ``['worker', queue_location, concurrency]`` to start worker mode
+
+    Notes
+    -----
+    A resumed job finds its checkpoints in the failed job's process folder,
+    which is named from the email address and proc_id (see
+    :attr:`SetUp.process_path`). Resume with the same proc_id and email as the
+    failed run - with a new proc_id the job starts again from scratch.
+    """
+
+    try:
+        # debugging = args[5]  # 'False'
+        debugging = 'False'
+
+        if args and args[0] == 'worker':
+            run_worker(*args[1:3])
+            return
+
+        # Check out standard arcpy things
+        arcpy_defaults()
+
+        log_level, proc_id, email, gdb_name = args[:4]
+        resume = len(args) > 4 and args[4].lower() == 'resume'
+        run_job(worker.JobRequest(proc_id, email, gdb_name, log_level, resume=resume))
 
     except Exception as e:
         logging.exception("Fatal error in main program: ")
-        sys.exit("\n{}\nScript failed - exiting now.".format(e))
+        sys.exit("\n{}\nScript failed - exiting now. Rerun with the same proc_id and email "
+                 "and 'resume' as the last argument to continue from the last completed "
+                 "step.".format(e))
     finally:
         logging.shutdown()
 
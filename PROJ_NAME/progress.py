@@ -0,0 +1,238 @@
+# =================================================================
+# Script name: progress.py
+#
+# Description: keep a small JSON status file up to date while a job
+# runs, so operators can see what it is doing and how fast
+# =================================================================
+
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class StepProgress(object):
+    """Row counter for one running step, from :meth:`ProgressReporter.start_step`.
+
+    :meth:`advance` is meant to be called inside per-row loops: most calls only
+    add to a counter, and the clock is only looked at every ``check_every``
+    rows.
+
+    Attributes
+    ----------
+    name: str
+        Step name
+    rows: int
+        Rows processed so far
+    total_rows: int
+        Rows expected (None if not known)
+    started: float
+        Epoch seconds the step started
+    """
+
+    def __init__(self, reporter, name, total_rows=None, check_every=1000):
+        self.reporter = reporter
+        self.name = name
+        self.rows = 0
+        self.total_rows = total_rows
+        self.started = time.time()
+        self.check_every = check_every
+        self._next_check = check_every
+
+    def advance(self, n=1):
+        """Count ``n`` more rows processed.
+
+        Returns
+        -------
+        None
+        """
+        self.rows += n
+        if self.rows >= self._next_check:
+            self._next_check = self.rows + self.check_every
+            self.reporter.write()
+
+    def status(self, now):
+        """Return this step's part of the status file."""
+        elapsed = now - self.started
+        rate = self.rows / elapsed if elapsed > 0 else None
+        eta = None
+        if rate and self.total_rows is not None:
+            eta = round(max(self.total_rows - self.rows, 0) / rate, 1)
+        return {'rows': self.rows,
+                'total_rows': self.total_rows,
+                'elapsed_s': round(elapsed, 1),
+                'rows_per_s': round(rate, 1) if rate is not None else None,
+                'eta_s': eta}
+
+
+class ProgressReporter(object):
+    """Write a job's progress to a JSON status file, at most once per interval.
+
+    The file is written to a temporary name and swapped in, so anything polling
+    it always reads a complete file. It looks like:
+
+    .. code-block:: text
+
+        {"job_id": "kitty_12", "state": "running", "updated": "2018-10-01 08:00:31",
+         "steps_done": 3, "steps_failed": 0, "failed_steps": [], "steps_total": 7,
+         "running": {"roads": {"rows": 52000, "total_rows": 80000, "elapsed_s": 26.0,
+                               "rows_per_s": 2000.0, "eta_s": 14.0}},
+         "finished": {"streams": {"rows": 9000, "total_rows": null, "elapsed_s": 3.1,
+                                  "rows_per_s": 2903.2, "eta_s": null}}}
+
+    Several steps can run at once (see :class:`steps.StepGraph`), so every
+    running step is listed; finished steps keep their final figures. Step
+    functions count rows with :func:`steps.count_rows`, which works whether
+    steps run in threads or processes. The status file is only a view on the job, so a
+    failure to write it is logged and otherwise ignored.
+
+    Attributes
+    ----------
+    path: str
+        Full path to the status file
+    job_id: str
+        Job identifier written into the file
+    min_interval: float
+        Least number of seconds between writes (start, finish and state
+        changes are always written)
+    """
+
+    def __init__(self, path, job_id=None, min_interval=2.0):
+        """
+        Parameters
+        ----------
+        path: str
+            Full path to the status file, e.g. in :attr:`main.SetUp.process_path`
+        job_id: str, optional
+            Job identifier written into the file
+        min_interval: float, optional
+            Least number of seconds between writes. Defaults to 2.
+        """
+        self.path = path
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self.state = 'running'
+        self.steps_done = 0
+        self.failed_steps = []
+        self.steps_total = None
+        self._running = {}
+        self._finished = {}
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def set_steps_total(self, steps_total):
+        """Record how many steps the job has.
+
+        Returns
+        -------
+        None
+        """
+        self.steps_total = steps_total
+        self.write(force=True)
+
+    def start_step(self, name, total_rows=None, check_every=1000):
+        """Start tracking a step.
+
+        Parameters
+        ----------
+        name: str
+            Step name
+        total_rows: int, optional
+            Rows expected, for the time remaining estimate
+        check_every: int, optional
+            Rows between looks at the clock. Defaults to 1000.
+
+        Returns
+        -------
+        StepProgress
+        """
+        step = StepProgress(self, name, total_rows, check_every)
+        with self._lock:
+            self._running[name] = step
+        self.write(force=True)
+        return step
+
+    def get(self, name):
+        """Return the tracker for a running step, or None.
+
+        Step functions run in threads can find their own tracker with
+        ``progress.get(steps.current_step())``, but :func:`steps.count_rows`
+        works from processes too.
+        """
+        return self._running.get(name)
+
+    def finish_step(self, name):
+        """Stop tracking a step and count it as done.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            step = self._running.pop(name, None)
+            if step is not None:
+                self._finished[name] = step.status(time.time())
+            self.steps_done += 1
+        self.write(force=True)
+
+    def fail_step(self, name):
+        """Stop tracking a step and count it as failed (not done).
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._running.pop(name, None)
+            self.failed_steps.append(name)
+        self.write(force=True)
+
+    def finish(self, state='finished'):
+        """Mark the whole job finished (or 'failed').
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self.state = state
+            self._running = {}
+        self.write(force=True)
+
+    def write(self, force=False):
+        """Write the status file if ``min_interval`` has passed (or ``force``).
+
+        Returns
+        -------
+        bool
+            True if the file was written (False if it was not due, or could
+            not be written)
+        """
+        now = time.time()
+        if not force and now - self._last_write < self.min_interval:
+            return False
+        with self._lock:
+            if not force and now - self._last_write < self.min_interval:
+                return False
+            self._last_write = now
+            status = {'job_id': self.job_id,
+                      'state': self.state,
+                      'updated': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)),
+                      'steps_done': self.steps_done,
+                      'steps_failed': len(self.failed_steps),
+                      'failed_steps': list(self.failed_steps),
+                      'steps_total': self.steps_total,
+                      'running': {name: step.status(now) for name, step in self._running.items()},
+                      'finished': dict(self._finished)}
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(status, f, indent=1)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                log.warning("Could not write status file {}: {}".format(self.path, e))
+                return False
+        return True
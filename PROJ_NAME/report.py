@@ -0,0 +1,210 @@
+# =================================================================
+# Script name: report.py
+#
+# Description: render result table rows into text, HTML or CSV
+# reports, streaming a chunk of rows at a time
+# =================================================================
+# Note: Nothing in here uses arcpy - rows come in from any iterable (an
+# arcpy.da.SearchCursor in main.py), which allows testing without mocks
+
+import csv
+import html
+import string
+
+try:
+    import util
+except ImportError:
+    from PROJ_NAME import util
+
+
+class ReportRenderer(object):
+    """Render rows of a result table as a text, HTML or CSV report.
+
+    Everything that can be worked out ahead of time is done once, when the
+    renderer is made: the text row template is compiled to a positional
+    format string, and each column's clean-up functions are looked up. Rows
+    are then read a chunk at a time, cleaned up column by column (dates with
+    :func:`util.better_strftime`, brackets with :func:`util.remove_bracket`),
+    and written straight to the output, so memory use does not grow with the
+    number of rows.
+
+    Example
+    -------
+    .. code-block:: python
+
+        # This code block commented because it is for example purposes only (should not be run)
+
+        # renderer = ReportRenderer(['ROAD_ID', 'NAME', 'BUILT'], date_columns=['BUILT'],
+        #                           bracket_columns=['NAME'],
+        #                           text_row="Road {ROAD_ID}: {NAME} (built {BUILT})")
+        # with arcpy.da.SearchCursor(roads_fc, renderer.columns) as cursor, open(out_path, 'w') as f:
+        #     renderer.render(cursor, f, output='text')
+
+    Attributes
+    ----------
+    columns: list
+        Column names, in the order values appear in each row
+    title: str
+        Heading written at the top of text and HTML reports
+    """
+
+    def __init__(self, columns, date_columns=(), bracket_columns=(), date_format="%m/%d/%Y",
+                 text_row=None, title=None):
+        """
+        Parameters
+        ----------
+        columns: list
+            Column names, in the order values appear in each row
+        date_columns: iterable, optional
+            Columns to format with ``date_format``
+        bracket_columns: iterable, optional
+            Columns to strip angled brackets from
+        date_format: str, optional
+            Datetime formatting style. Defaults to '%m/%d/%Y'.
+        text_row: str, optional
+            Template for one row of a text report, with column names in braces,
+            e.g. ``"{ROAD_ID}: {NAME}"``. Defaults to all columns joined by ' | '.
+        title: str, optional
+            Heading for text and HTML reports
+
+        Raises
+        ------
+        ValueError
+            If a template or clean-up column is not one of ``columns``
+        """
+        self.columns = list(columns)
+        self.title = title
+        unknown = [c for c in list(date_columns) + list(bracket_columns) if c not in self.columns]
+        if unknown:
+            raise ValueError("Unknown report column(s): {}".format(", ".join(unknown)))
+
+        # Clean-up functions per column position, applied in this order
+        self._converters = {}
+        for name in date_columns:
+            self._converters.setdefault(self.columns.index(name), []).append(
+                lambda value: util.better_strftime(value, date_format))
+        for name in bracket_columns:
+            # remove_bracket gives None for anything that isn't a string
+            self._converters.setdefault(self.columns.index(name), []).append(
+                lambda value: util.remove_bracket(value) if isinstance(value, str) else value)
+
+        if text_row is None:
+            text_row = " | ".join("{" + c + "}" for c in self.columns)
+        self._text_fields = self._compile(text_row)
+        self._text_format = "".join(
+            literal.replace('{', '{{').replace('}', '}}')
+            + ("" if position is None else "{" + str(position)
+               + ("!" + conversion if conversion else "")
+               + (":" + spec if spec else "") + "}")
+            for literal, position, conversion, spec in self._text_fields)
+
+    def _compile(self, template):
+        """Split a template into (literal, row position, conversion, spec) tuples."""
+        fields = []
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            if field is None:
+                fields.append((literal, None, None, None))
+                continue
+            if field not in self.columns:
+                raise ValueError("Unknown report column in template: {}".format(field))
+            fields.append((literal, self.columns.index(field), conversion, spec))
+        return fields
+
+    def _format_with_nulls(self, row):
+        """Format a text row that has NULLs, leaving each NULL field empty.
+
+        NULLs don't go through the field's format spec, which would fail for
+        e.g. ``{ACRES:.1f}``.
+        """
+        parts = []
+        for literal, position, conversion, spec in self._text_fields:
+            parts.append(literal)
+            if position is None or row[position] is None:
+                continue
+            value = row[position]
+            if conversion:
+                value = {'r': repr, 's': str, 'a': ascii}[conversion](value)
+            parts.append(format(value, spec or ''))
+        return "".join(parts)
+
+    def _clean(self, chunk, blank_nulls=True):
+        """Apply the column clean-up functions to a chunk of rows, a column at a time."""
+        values = [list(column) for column in zip(*chunk)]
+        for position, converters in self._converters.items():
+            for convert in converters:
+                values[position] = list(map(convert, values[position]))
+        if blank_nulls:
+            for position, column in enumerate(values):
+                values[position] = ['' if v is None else v for v in column]
+        return zip(*values)
+
+    def _chunks(self, rows, chunk_size, blank_nulls=True):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield self._clean(chunk, blank_nulls)
+                chunk = []
+        if chunk:
+            yield self._clean(chunk, blank_nulls)
+
+    def render(self, rows, out, output='text', chunk_size=5000):
+        """Write a report of ``rows`` to a file-like object.
+
+        Parameters
+        ----------
+        rows: iterable
+            Row tuples, in the same order as :attr:`columns`
+        out: file-like object
+            Text stream to write to (open CSV files with ``newline=''``)
+        output: str, optional
+            'text', 'html' or 'csv'. Defaults to 'text'.
+        chunk_size: int, optional
+            Rows held in memory at once. Defaults to 5000.
+
+        Returns
+        -------
+        int
+            Number of rows written
+
+        Raises
+        ------
+        ValueError
+            If ``output`` is not recognised
+        """
+        if output not in ('text', 'html', 'csv'):
+            raise ValueError("Unknown report output: {}".format(output))
+        count = 0
+        if output == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(self.columns)
+            for chunk in self._chunks(rows, chunk_size):
+                chunk = list(chunk)
+                writer.writerows(chunk)
+                count += len(chunk)
+            return count
+
+        if output == 'html':
+            if self.title:
+                out.write("<h2>{}</h2>\n".format(html.escape(self.title)))
+            out.write("<table>\n<tr>{}</tr>\n".format(
+                "".join("<th>{}</th>".format(html.escape(c)) for c in self.columns)))
+            for chunk in self._chunks(rows, chunk_size):
+                lines = ["<tr>{}</tr>\n".format("".join("<td>{}</td>".format(html.escape(str(v)))
+                                                        for v in row))
+                         for row in chunk]
+                out.write("".join(lines))
+                count += len(lines)
+            out.write("</table>\n")
+            return count
+
+        if self.title:
+            out.write("{}\n\n".format(self.title))
+        text_format = self._text_format
+        # NULLs are kept as None here so they can skip the field's format spec
+        for chunk in self._chunks(rows, chunk_size, blank_nulls=False):
+            lines = [self._format_with_nulls(row) if None in row else text_format.format(*row)
+                     for row in chunk]
+            out.write("\n".join(lines) + "\n")
+            count += len(lines)
+        return count
@@ -0,0 +1,274 @@
+# =================================================================
+# Script name: result_cache.py
+#
+# Description: reuse the finished outputs of an identical earlier
+# checklist request instead of running the analysis again
+# =================================================================
+# Note: Nothing in here uses arcpy - a gdb is just a folder as far as
+# copying it goes
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+
+log = logging.getLogger(__name__)
+
+
+def cache_key(gdb_name, params=None, sources=None, required=()):
+    """Build a cache key from the parts of a request that affect its results.
+
+    Who asked (email, process ID) and how (log level, resume) are left out, so
+    the same sale area submitted twice, or by two people, gets the same key.
+    Parameter names are lower-cased and string values stripped before hashing.
+
+    The gdb name alone does not say which sale area a job is for, so there is
+    no key (and the cache is not used) unless the request carries its analysis
+    parameters. The state of the source data is part of the key, so results
+    are not reused once the sources have been edited.
+
+    Parameters
+    ----------
+    gdb_name: str
+        Geodatabase name
+    params: dict, optional
+        Analysis parameters
+    sources: dict, optional
+        Source name -> state (something JSON-able that changes when the source
+        changes, e.g. from :func:`main.source_state`)
+    required: iterable, optional
+        Parameter names (lower case) that must be present for there to be a key
+
+    Returns
+    -------
+    str or None
+        None if ``params`` is empty or is missing a ``required`` name
+    """
+    normalized = {}
+    for name, value in (params or {}).items():
+        if isinstance(value, str):
+            value = value.strip()
+        normalized[name.strip().lower()] = value
+    if not normalized or any(name not in normalized for name in required):
+        return None
+    text = json.dumps({'gdb_name': gdb_name.strip().lower(), 'params': normalized,
+                       'sources': sources or {}}, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _folder_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class ResultCache(object):
+    """Finished job outputs kept on disk, keyed by :func:`cache_key`.
+
+    Each entry is a folder under ``folder`` holding copies of a job's outputs
+    (its gdb, exports, ...). An SQLite index records when each entry was made
+    and last used, so several workers can share the cache. Entries older than
+    ``ttl`` seconds are dropped, and the least recently used entries are
+    dropped once there are more than ``max_entries`` or they take up more than
+    ``max_bytes``.
+
+    Attributes
+    ----------
+    folder: str
+        Full path to the cache folder
+    ttl: float
+        Seconds an entry stays valid
+    max_entries: int
+        Most entries kept
+    max_bytes: int
+        Most disk space used by all entries (None for no limit)
+    """
+
+    def __init__(self, folder, ttl=7 * 24 * 3600, max_entries=50, max_bytes=None):
+        """
+        Parameters
+        ----------
+        folder: str
+            Full path to the cache folder (created if it does not exist)
+        ttl: float, optional
+            Seconds an entry stays valid. Defaults to one week.
+        max_entries: int, optional
+            Most entries kept. Defaults to 50.
+        max_bytes: int, optional
+            Most disk space used by all entries. Defaults to no limit.
+        """
+        self.folder = os.path.abspath(folder)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "key TEXT PRIMARY KEY, created REAL, last_used REAL, size INTEGER)")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.folder, "cache.db"), timeout=30,
+                               isolation_level=None)
+
+    def _entry_path(self, key):
+        return os.path.join(self.folder, key)
+
+    def get(self, key):
+        """Look up a fresh entry.
+
+        Parameters
+        ----------
+        key: str
+            Output of :func:`cache_key`
+
+        Returns
+        -------
+        str or None
+            Full path to the entry's folder, or None if there is no fresh entry
+            (always None if ``key`` is None)
+        """
+        if key is None:
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[0] > self.ttl or not os.path.isdir(self._entry_path(key)):
+                self._remove(conn, key)
+                return None
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        finally:
+            conn.close()
+        return self._entry_path(key)
+
+    def put(self, key, source_folder, names):
+        """Copy a finished job's outputs into the cache.
+
+        The copy is made under a temporary name and renamed into place, so a
+        reader never sees a half-copied entry. If another job cached the same
+        key first, its entry is kept.
+
+        Parameters
+        ----------
+        key: str
+            Output of :func:`cache_key`
+        source_folder: str
+            Full path to the job's process folder
+        names: list
+            Files/folders in ``source_folder`` to cache (e.g. the gdb)
+
+        Returns
+        -------
+        str or None
+            Full path to the entry's folder (None, and nothing cached, if
+            ``key`` is None)
+        """
+        if key is None:
+            return None
+        final_path = self._entry_path(key)
+        tmp_path = "{}.{}.tmp".format(final_path, uuid.uuid4().hex[:8])
+        os.makedirs(tmp_path)
+        try:
+            for name in names:
+                source = os.path.join(source_folder, name)
+                if os.path.isdir(source):
+                    shutil.copytree(source, os.path.join(tmp_path, name))
+                elif os.path.exists(source):
+                    shutil.copy2(source, tmp_path)
+            if os.path.isdir(final_path):
+                # Stale or expired entry for the same key
+                shutil.rmtree(final_path)
+            os.rename(tmp_path, final_path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if os.path.isdir(final_path):
+                log.info("Result cache entry {} written by another job".format(key))
+                return final_path
+            raise
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute("INSERT OR REPLACE INTO entries (key, created, last_used, size) "
+                         "VALUES (?, ?, ?, ?)", (key, now, now, _folder_size(final_path)))
+            self._evict(conn)
+        finally:
+            conn.close()
+        return final_path
+
+    def restore(self, key, dest_folder):
+        """Copy a cached entry's outputs into a job's process folder.
+
+        Anything already in ``dest_folder`` with the same name (e.g. the empty
+        gdb made by :class:`main.SetUp`) is replaced.
+
+        Parameters
+        ----------
+        key: str
+            Output of :func:`cache_key`
+        dest_folder: str
+            Full path to the job's process folder
+
+        Returns
+        -------
+        bool
+            True if the entry was found and copied
+        """
+        entry_path = self.get(key)
+        if entry_path is None:
+            return False
+        for name in os.listdir(entry_path):
+            source = os.path.join(entry_path, name)
+            dest = os.path.join(dest_folder, name)
+            if os.path.isdir(dest):
+                shutil.rmtree(dest)
+            if os.path.isdir(source):
+                shutil.copytree(source, dest)
+            else:
+                shutil.copy2(source, dest)
+        return True
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones over the limits.
+
+        Returns
+        -------
+        None
+        """
+        conn = self._connect()
+        try:
+            self._evict(conn)
+        finally:
+            conn.close()
+
+    def _evict(self, conn):
+        for (key,) in conn.execute("SELECT key FROM entries WHERE created < ?",
+                                   (time.time() - self.ttl,)).fetchall():
+            self._remove(conn, key)
+        rows = conn.execute("SELECT key, size FROM entries ORDER BY last_used DESC").fetchall()
+        kept = total = 0
+        for key, size in rows:
+            if kept >= self.max_entries or (self.max_bytes is not None
+                                            and total + size > self.max_bytes):
+                self._remove(conn, key)
+            else:
+                kept += 1
+                total += size
+
+    def _remove(self, conn, key):
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        shutil.rmtree(self._entry_path(key), ignore_errors=True)
+        log.debug("Evicted result cache entry {}".format(key))
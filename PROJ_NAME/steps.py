@@ -0,0 +1,755 @@
+# =================================================================
+# Script name: steps.py
+#
+# Description: declare analysis steps as a dependency graph and run
+# independent steps side by side
+# =================================================================
+# Note: Nothing in here uses arcpy - steps are plain callables, so the
+# scheduling can be tested without mocks
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+log = logging.getLogger(__name__)
+
+# Name of the step running in the current thread, for log records (see current_step),
+# and where its row counts go (see count_rows)
+_context = threading.local()
+
+# Rows a step counts before they are sent on to the scheduler (see count_rows)
+ROWS_BATCH = 1000
+
+
+class StepGraphError(ValueError):
+    """Raised when the declared steps do not form a valid dependency graph."""
+    pass
+
+
+class Step(object):
+    """One unit of work in a :class:`StepGraph`.
+
+    Attributes
+    ----------
+    name: str
+        Unique step name (used in the log)
+    func: callable
+        Called as ``func(**kwargs)``
+    inputs: tuple
+        Names (usually paths) the step reads
+    outputs: tuple
+        Names (usually paths) the step writes
+    kwargs: dict
+        Keyword arguments for ``func``
+    unhashed: tuple
+        Names of keyword arguments left out of the step's hashes
+    total_rows: int
+        Rows the step is expected to process, for the status file (None if
+        not known)
+    start: float
+        Epoch seconds the step started (None until run)
+    end: float
+        Epoch seconds the step finished (None until run)
+    result: any type
+        Whatever ``func`` returned
+    fingerprint: str
+        Hash of the step's parameters and inputs (None unless a store is used)
+    skipped: bool
+        True if the step was skipped because its fingerprint was unchanged
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), kwargs=None, unhashed=(),
+                 total_rows=None):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.kwargs = kwargs or {}
+        self.unhashed = tuple(unhashed)
+        self.total_rows = total_rows
+        self.start = None
+        self.end = None
+        self.result = None
+        self.fingerprint = None
+        self.skipped = False
+
+    def __repr__(self):
+        return "Step({!r})".format(self.name)
+
+    @property
+    def duration(self):
+        """Seconds the step took, or 0 if it has not run."""
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+def current_step():
+    """Return the name of the step running in this thread, or None.
+
+    Lets log records written from inside a step function be tagged with the
+    step (see :class:`json_logging.JobContextFilter`).
+    """
+    return getattr(_context, 'step', None)
+
+
+def count_rows(n=1):
+    """Count rows processed by the step running in this thread or process.
+
+    Meant to be called inside a step function's per-row loops. Counts are
+    sent to the scheduler :data:`ROWS_BATCH` rows at a time (and when the step
+    ends), which passes them on to the job's status file - this works whether
+    steps run in threads or processes. Does nothing outside a step, or if the
+    graph has no status file.
+
+    Parameters
+    ----------
+    n: int, optional
+        Rows processed since the last call. Defaults to 1.
+
+    Returns
+    -------
+    None
+    """
+    if getattr(_context, 'rows_queue', None) is None:
+        return
+    _context.pending_rows += n
+    if _context.pending_rows >= ROWS_BATCH:
+        _send_rows()
+
+
+def _send_rows():
+    if _context.pending_rows:
+        _context.rows_queue.put((_context.step, _context.pending_rows))
+        _context.pending_rows = 0
+
+
+def _timed_call(name, func, kwargs, rows_queue=None):
+    """Run ``func(**kwargs)`` as step ``name`` and return (result, start, end).
+
+    Module-level so it can be sent to a process pool.
+    """
+    _context.step = name
+    _context.rows_queue = rows_queue
+    _context.pending_rows = 0
+    try:
+        start = time.time()
+        result = func(**kwargs)
+        return result, start, time.time()
+    finally:
+        if rows_queue is not None:
+            # Sent before the result, so the scheduler has every row by the time it sees the end
+            _send_rows()
+        _context.step = None
+        _context.rows_queue = None
+
+
+def file_state(path):
+    """Describe the current state of a source file cheaply.
+
+    Parameters
+    ----------
+    path: str
+        Full path to a file or folder
+
+    Returns
+    -------
+    list or None
+        [modified time, size], or None if the path does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size]
+
+
+class FingerprintStore(object):
+    """Step fingerprints from previous runs, kept in a JSON file in the process folder.
+
+    The file is rewritten (to a temp file, then swapped in) every time a step
+    finishes, so it is never left half-written if the job dies.
+
+    Attributes
+    ----------
+    path: str
+        Full path to the JSON file
+    fingerprints: dict
+        Step name -> fingerprint
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path: str
+            Full path to the JSON file (need not exist yet)
+        """
+        self.path = path
+        try:
+            with open(path) as f:
+                self.fingerprints = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.fingerprints = {}
+
+    def get(self, name):
+        """Return the recorded fingerprint for a step, or None."""
+        return self.fingerprints.get(name)
+
+    def set(self, name, fingerprint):
+        """Record a step's fingerprint and save the file.
+
+        Returns
+        -------
+        None
+        """
+        self.fingerprints[name] = fingerprint
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.fingerprints, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+class CheckpointLog(object):
+    """Durable record of the steps a job has finished, kept in the process folder.
+
+    One JSON line is appended (and flushed to disk) as each step finishes, so
+    the record survives the job crashing part way through. A half-written last
+    line from a crash is ignored when the file is read back.
+
+    Attributes
+    ----------
+    path: str
+        Full path to the checkpoint file
+    completed: dict
+        Step name -> parameter hash recorded when the step finished
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path: str
+            Full path to the checkpoint file (need not exist yet)
+        """
+        self.path = path
+        self.completed = {}
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.completed[entry['step']] = entry['params']
+        except (IOError, OSError):
+            pass
+
+    def reset(self):
+        """Forget all checkpoints (start of a fresh, non-resumed run).
+
+        Returns
+        -------
+        None
+        """
+        open(self.path, 'w').close()
+        self.completed = {}
+
+    def record(self, name, params):
+        """Append a finished step to the checkpoint file.
+
+        Parameters
+        ----------
+        name: str
+            Step name
+        params: str
+            Parameter hash of the step (see :meth:`StepGraph.param_hash`)
+
+        Returns
+        -------
+        None
+        """
+        entry = {'step': name, 'params': params, 'finished': time.time()}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed[name] = params
+
+    def is_complete(self, name, params):
+        """Return True if the step finished with the same parameters."""
+        return self.completed.get(name) == params
+
+
+class StepGraph(object):
+    """Run steps in dependency order, running independent steps at the same time.
+
+    A step depends on another step if one of its inputs is one of the other
+    step's outputs. Inputs that no step produces (e.g. ROPA feature classes)
+    are treated as sources that already exist.
+
+    If a :class:`FingerprintStore` is given, each step is fingerprinted from
+    its function, keyword arguments (e.g. the where clause), the state of its
+    source inputs and the fingerprints of the steps it depends on. A step whose
+    fingerprint matches the last successful run, and whose outputs all still
+    exist, is skipped - so a rerun only redoes what changed and whatever is
+    downstream of it.
+
+    If a :class:`CheckpointLog` is given, every finished step is checkpointed.
+    Running with ``resume=True`` then skips any step checkpointed with the same
+    parameters whose outputs still exist, without looking at the source data
+    again - so a job that failed near the end picks up where it stopped.
+
+    Example
+    -------
+    .. code-block:: python
+
+        # This code block commented because it is for example purposes only (should not be run)
+
+        # steps = StepGraph(log=mem.log)
+        # steps.add('roads', read_in_clip, outputs=[roads_fc],
+        #           in_fc='ROPA.ROADS', out_fc=roads_fc, ropa_path=ropa_path, clip_fc=sale_fc)
+        # steps.add('streams', read_in_clip, outputs=[streams_fc],
+        #           in_fc='ROPA.STREAMS', out_fc=streams_fc, ropa_path=ropa_path, clip_fc=sale_fc)
+        # steps.add('road_miles', summarize_roads, inputs=[roads_fc], in_fc=roads_fc)
+        # steps.run(max_workers=4)
+
+    Attributes
+    ----------
+    steps: list
+        Steps in the order they were added
+    log: logging object
+        Where step start/finish messages are written
+    store: FingerprintStore
+        Fingerprints from earlier runs (None to always run every step)
+    source_state: callable
+        Called with a source input name, returns something JSON-able that
+        changes when the source changes. Called once per source per graph, on
+        the step executor (so it must be picklable if steps run in processes).
+    exists: callable
+        Called with an output name, returns True if it exists
+    checkpoint: CheckpointLog
+        Record of finished steps (None to not checkpoint)
+    progress: progress.ProgressReporter
+        Status file updated as steps start and finish (None for no status file)
+    """
+
+    def __init__(self, log=None, store=None, source_state=file_state, exists=os.path.exists,
+                 checkpoint=None, progress=None):
+        """
+        Parameters
+        ----------
+        log: logging object, optional
+            Job logger. Defaults to this module's logger.
+        store: FingerprintStore, optional
+            Enables skipping unchanged steps
+        source_state: callable, optional
+            Defaults to :func:`file_state`. Pass something arcpy-aware for
+            feature classes.
+        exists: callable, optional
+            Defaults to ``os.path.exists``. Pass ``arcpy.Exists`` for gdb outputs.
+        checkpoint: CheckpointLog, optional
+            Enables resuming a failed run
+        progress: progress.ProgressReporter, optional
+            Status file to keep up to date. Step functions count rows with
+            :func:`count_rows`.
+        """
+        self.steps = []
+        self.log = log or logging.getLogger(__name__)
+        self.store = store
+        self.source_state = source_state
+        self.exists = exists
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self._source_states = {}
+
+    def add(self, name, func, inputs=(), outputs=(), unhashed=(), total_rows=None, **kwargs):
+        """Declare a step.
+
+        Keyword arguments are part of the step's hashes, so they must be
+        JSON-serialisable (str, numbers, lists, dicts...). Arguments that are
+        not, and that don't change what the step produces (e.g. a connection
+        pool), must be named in ``unhashed``.
+
+        Parameters
+        ----------
+        name: str
+            Unique step name
+        func: callable
+            Function to run
+        inputs: iterable, optional
+            Names (usually paths) the step reads
+        outputs: iterable, optional
+            Names (usually paths) the step writes
+        unhashed: iterable, optional
+            Names of keyword arguments to leave out of the step's hashes
+        total_rows: int, optional
+            Rows the step is expected to process, passed to
+            :meth:`progress.ProgressReporter.start_step` for the time remaining
+        kwargs:
+            Keyword arguments passed to ``func``
+
+        Returns
+        -------
+        Step
+
+        Raises
+        ------
+        StepGraphError
+            If the name is already used, or a hashed keyword argument is not
+            JSON-serialisable
+        """
+        if name in [s.name for s in self.steps]:
+            raise StepGraphError("Duplicate step name: {}".format(name))
+        step = Step(name, func, inputs, outputs, kwargs, unhashed, total_rows)
+        try:
+            json.dumps(self._hashed_kwargs(step), sort_keys=True)
+        except (TypeError, ValueError) as e:
+            # A default like str() would hash objects by a repr that can hold a
+            # memory address, so the hash would change on every run
+            raise StepGraphError("Step {} has a keyword argument that can't be hashed ({}) - "
+                                 "pass it in unhashed".format(name, e))
+        self.steps.append(step)
+        return step
+
+    def dependencies(self):
+        """Work out which steps each step depends on.
+
+        Returns
+        -------
+        dict
+            Step name -> set of step names it needs to wait for
+
+        Raises
+        ------
+        StepGraphError
+            If two steps write the same output, or the steps have a cycle
+        """
+        producers = self.producers()
+        deps = {step.name: set(producers[i] for i in step.inputs
+                               if i in producers and producers[i] != step.name)
+                for step in self.steps}
+        self._check_acyclic(deps)
+        return deps
+
+    def producers(self):
+        """Map each output to the step that writes it.
+
+        Returns
+        -------
+        dict
+            Output name -> step name
+
+        Raises
+        ------
+        StepGraphError
+            If two steps write the same output
+        """
+        producers = {}
+        for step in self.steps:
+            for output in step.outputs:
+                if output in producers:
+                    raise StepGraphError("Output {} written by both {} and {}".format(
+                        output, producers[output], step.name))
+                producers[output] = step.name
+        return producers
+
+    def sources(self):
+        """List the inputs no step produces (e.g. ROPA feature classes).
+
+        Returns
+        -------
+        list
+            Input names, in the order steps were added
+        """
+        producers = self.producers()
+        sources = []
+        for step in self.steps:
+            sources.extend(i for i in step.inputs if i not in producers and i not in sources)
+        return sources
+
+    def source_states(self, names=None, executor=None):
+        """Return the state of source inputs, working out any not known yet.
+
+        Each source's state is only worked out once per graph, and reused by
+        every step that reads it (and by callers, e.g. for a result cache key).
+
+        Parameters
+        ----------
+        names: iterable, optional
+            Source input names. Defaults to all of :meth:`sources`.
+        executor: concurrent.futures.Executor, optional
+            Work out states side by side on this (e.g. the step processes, for
+            a ``source_state`` that must not run on threads). Defaults to one
+            after another in this thread.
+
+        Returns
+        -------
+        dict
+            Source name -> state
+        """
+        names = self.sources() if names is None else list(names)
+        unknown = [name for name in dict.fromkeys(names) if name not in self._source_states]
+        if unknown:
+            states = executor.map(self.source_state, unknown) if executor else map(
+                self.source_state, unknown)
+            self._source_states.update(zip(unknown, states))
+        return {name: self._source_states[name] for name in names}
+
+    def param_hash(self, step):
+        """Hash a step's function, arguments and outputs (but not its inputs' state).
+
+        Parameters
+        ----------
+        step: Step
+
+        Returns
+        -------
+        str
+        """
+        text = json.dumps(self._param_parts(step), sort_keys=True)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _hashed_kwargs(step):
+        return {k: v for k, v in step.kwargs.items() if k not in step.unhashed}
+
+    def _param_parts(self, step):
+        func_name = "{}.{}".format(getattr(step.func, '__module__', ''),
+                                   getattr(step.func, '__name__', repr(step.func)))
+        return [step.name, func_name, self._hashed_kwargs(step), list(step.outputs)]
+
+    def fingerprint(self, step):
+        """Hash a step's function, arguments and inputs.
+
+        Steps it depends on must already have been fingerprinted.
+
+        Parameters
+        ----------
+        step: Step
+
+        Returns
+        -------
+        str
+        """
+        producers = self.producers()
+        by_name = {s.name: s for s in self.steps}
+        parts = self._param_parts(step)
+        for name in step.inputs:
+            if name in producers and producers[name] != step.name:
+                parts.append([name, by_name[producers[name]].fingerprint])
+            else:
+                parts.append([name, self.source_states([name])[name]])
+        text = json.dumps(parts, sort_keys=True)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _is_checkpointed(self, step):
+        return (self.checkpoint.is_complete(step.name, self.param_hash(step))
+                and all(self.exists(output) for output in step.outputs))
+
+    def _is_unchanged(self, step):
+        step.fingerprint = self.fingerprint(step)
+        return (self.store.get(step.name) == step.fingerprint
+                and all(self.exists(output) for output in step.outputs))
+
+    def _check_acyclic(self, deps):
+        done = set()
+        remaining = dict(deps)
+        while remaining:
+            ready = [name for name, needs in remaining.items() if needs <= done]
+            if not ready:
+                raise StepGraphError("Steps have a circular dependency: {}".format(
+                    ", ".join(sorted(remaining))))
+            for name in ready:
+                done.add(name)
+                del remaining[name]
+
+    def run(self, max_workers=4, use_processes=False, resume=False, initializer=None,
+            executor=None, rows_queue=None):
+        """Run all steps, starting each as soon as the steps it depends on finish.
+
+        Steps whose fingerprint is unchanged, or that were checkpointed when
+        resuming, are skipped (see the class notes).
+        If a step fails, no new steps are started; steps already running are
+        allowed to finish and then the original exception is raised.
+
+        Parameters
+        ----------
+        max_workers: int, optional
+            Maximum number of steps running at once. Defaults to 4.
+        use_processes: bool, optional
+            Run steps in separate processes rather than threads (for steps that
+            are not thread-safe). Step functions and arguments must then be
+            picklable. Defaults to False.
+        resume: bool, optional
+            Skip steps already checkpointed by an earlier (failed) run. When
+            False, existing checkpoints are cleared. Defaults to False.
+        initializer: callable, optional
+            Called with no arguments in each worker thread or process before it
+            runs any steps (e.g. to set environment settings in a new process)
+        executor: concurrent.futures.Executor, optional
+            Run steps on this executor, and leave it running afterwards, so its
+            workers (and anything they keep open) are reused by later runs.
+            ``max_workers``, ``use_processes`` and ``initializer`` are then
+            ignored. Defaults to a new executor for this run.
+        rows_queue: queue, optional
+            Queue that steps' :func:`count_rows` counts are sent back on. Steps
+            run in processes need a ``multiprocessing.Manager().Queue()``; pass
+            one to reuse a manager across runs. Defaults to a new queue (and,
+            for processes, a new manager) for this run if there is a status file.
+
+        Returns
+        -------
+        dict
+            Step name -> whatever the step function returned
+        """
+        deps = self.dependencies()
+        by_name = {step.name: step for step in self.steps}
+        pending = [step.name for step in self.steps]
+        done = set()
+        running = {}
+        failure = None
+        run_start = time.time()
+        if self.checkpoint is not None and not resume:
+            self.checkpoint.reset()
+        if self.progress is not None:
+            self.progress.set_steps_total(len(self.steps))
+        if executor is not None:
+            pool_context = nullcontext(executor)
+        else:
+            pool_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+            pool_context = pool_class(max_workers=max_workers, initializer=initializer)
+        manager = None
+        if self.progress is not None and rows_queue is None:
+            if isinstance(executor, ProcessPoolExecutor) or (executor is None and use_processes):
+                manager = multiprocessing.Manager()
+                rows_queue = manager.Queue()
+            else:
+                rows_queue = queue.Queue()
+        # The manager (if any) is shut down last, once every step has finished
+        with (manager if manager is not None else nullcontext()), pool_context as pool:
+            if self.store is not None:
+                # Work out every source state the fingerprints will need up front,
+                # side by side, rather than one at a time as steps become ready
+                to_check = [step for step in self.steps if not (
+                    resume and self.checkpoint is not None
+                    and self.checkpoint.is_complete(step.name, self.param_hash(step)))]
+                sources = set(self.sources())
+                self.source_states([i for step in to_check for i in step.inputs if i in sources],
+                                   executor=pool)
+            while True:
+                ready = [n for n in pending if deps[n] <= done] if failure is None else []
+                while ready:
+                    for name in ready:
+                        pending.remove(name)
+                        step = by_name[name]
+                        if resume and self.checkpoint is not None and self._is_checkpointed(step):
+                            if self.store is not None:
+                                # Downstream fingerprints are built from this one; the
+                                # stored one saves looking at the source data again
+                                step.fingerprint = self.store.get(step.name)
+                            self._skip(step, done)
+                            self.log.info("Step {} skipped (checkpoint)".format(name),
+                                          extra={'step': name})
+                            continue
+                        if self.store is not None and self._is_unchanged(step):
+                            self._skip(step, done)
+                            self.log.info("Step {} skipped (unchanged)".format(name),
+                                          extra={'step': name})
+                            continue
+                        self.log.info("Step {} started".format(name), extra={'step': name})
+                        if self.progress is not None:
+                            self.progress.start_step(name, total_rows=step.total_rows)
+                        running[pool.submit(_timed_call, name, step.func, step.kwargs,
+                                            rows_queue)] = step
+                    # Skipped steps may have made more steps ready
+                    ready = [n for n in pending if deps[n] <= done]
+                if not running:
+                    break
+                # Wake up now and then to pass row counts on to the status file
+                timeout = None if rows_queue is None else max(self.progress.min_interval, 0.1)
+                finished, _ = wait(running, return_when=FIRST_COMPLETED, timeout=timeout)
+                if rows_queue is not None:
+                    self._receive_rows(rows_queue)
+                for future in finished:
+                    step = running.pop(future)
+                    try:
+                        step.result, step.start, step.end = future.result()
+                    except Exception as e:
+                        if self.progress is not None:
+                            self.progress.fail_step(step.name)
+                        self.log.error("Step {} failed: {}".format(step.name, e),
+                                       extra={'step': step.name})
+                        failure = failure or e
+                        continue
+                    done.add(step.name)
+                    if self.progress is not None:
+                        self.progress.finish_step(step.name)
+                    if self.store is not None:
+                        self.store.set(step.name, step.fingerprint)
+                    if self.checkpoint is not None:
+                        self.checkpoint.record(step.name, self.param_hash(step))
+                    self.log.info("Step {} finished in {:.2f} s".format(step.name, step.duration),
+                                  extra={'step': step.name})
+        if failure is not None:
+            raise failure
+
+        wall = time.time() - run_start
+        path, length = self.critical_path()
+        self.log.info("Ran {} steps ({} skipped) in {:.2f} s (sum of steps {:.2f} s)".format(
+            len(self.steps), len([s for s in self.steps if s.skipped]), wall, sum(s.duration for s in self.steps)))
+        self.log.info("Critical path ({:.2f} s): {}".format(length, " -> ".join(path)))
+        return {step.name: step.result for step in self.steps}
+
+    def _receive_rows(self, rows_queue):
+        """Pass row counts sent by :func:`count_rows` on to the status file."""
+        while True:
+            try:
+                name, rows = rows_queue.get_nowait()
+            except queue.Empty:
+                return
+            tracker = self.progress.get(name)
+            if tracker is not None:
+                tracker.advance(rows)
+
+    def _skip(self, step, done):
+        step.skipped = True
+        done.add(step.name)
+        if self.progress is not None:
+            self.progress.finish_step(step.name)
+
+    def critical_path(self):
+        """Find the longest chain of dependent steps, using the last run's durations.
+
+        Returns
+        -------
+        tuple
+            (list of step names from first to last, total seconds)
+        """
+        deps = self.dependencies()
+        by_name = {step.name: step for step in self.steps}
+        finish = {}
+        previous = {}
+        remaining = [step.name for step in self.steps]
+        while remaining:
+            for name in [n for n in remaining if deps[n] <= set(finish)]:
+                before = max(deps[name], key=lambda d: finish[d]) if deps[name] else None
+                previous[name] = before
+                finish[name] = by_name[name].duration + (finish[before] if before else 0.0)
+                remaining.remove(name)
+        if not finish:
+            return [], 0.0
+        name = max(finish, key=lambda n: finish[n])
+        length = finish[name]
+        path = []
+        while name is not None:
+            path.append(name)
+            name = previous[name]
+        return path[::-1], length
@@ -4,6 +4,7 @@
 import logging
 import os
 import smtplib
+import time
 import uuid
 from collections import OrderedDict
 from email import encoders
@@ -15,10 +16,93 @@ from email.utils import COMMASPACE, formatdate
 # Optional: add logging
 # At this point there is no logging inside utility functions because I
 # can't image what I'd want to log here - but the call to get logger is
-# included in case I change my mind
+# included in case I change my mind. For logging inside per-record loops
+# use SampledLog.
 log = logging.getLogger(__name__)
 
 
+class SampledLog(object):
+    """Log only some of many repeated messages, e.g. one per record in a loop.
+
+    Whether the logger is enabled for the level is checked once, up front, so a
+    loop run at INFO pays almost nothing for its DEBUG lines. When enabled, the
+    first message is logged and then one in every ``every`` messages, and/or
+    one per ``interval`` seconds; each logged message says how many were
+    skipped since the last one.
+
+    Example
+    -------
+    .. code-block:: python
+
+        # This code block commented because it is for example purposes only (should not be run)
+
+        # sampled = SampledLog(log, every=1000)
+        # for row in cursor:
+        #     sampled.emit("Processing road %s", row[0])
+
+    Attributes
+    ----------
+    log: logging object
+        Logger to write to
+    level: int
+        Logging level of the messages
+    every: int
+        Log one message in this many (None to only use ``interval``)
+    interval: float
+        Log at most one message per this many seconds (None to only use ``every``)
+    count: int
+        Messages seen so far, logged or not
+    """
+
+    def __init__(self, log, every=1000, interval=None, level=logging.DEBUG):
+        """
+        Parameters
+        ----------
+        log: logging object
+            Logger to write to
+        every: int, optional
+            Log one message in this many. Defaults to 1000.
+        interval: float, optional
+            Log at most one message per this many seconds
+        level: int, optional
+            Logging level of the messages. Defaults to DEBUG.
+        """
+        self.log = log
+        self.level = level
+        self.every = every
+        self.interval = interval
+        self.count = 0
+        self.enabled = log.isEnabledFor(level)
+        self._skipped = 0
+        self._last_time = None
+
+    def emit(self, msg, *args):
+        """Count a message and log it if it is due.
+
+        Arguments are only %-formatted into ``msg`` if the message is logged.
+
+        Returns
+        -------
+        None
+        """
+        if not self.enabled:
+            return
+        self.count += 1
+        due = self._last_time is None
+        if not due and self.every:
+            due = self.count % self.every == 0
+        if not due and self.interval is not None:
+            due = time.time() - self._last_time >= self.interval
+        if not due:
+            self._skipped += 1
+            return
+        if self._skipped:
+            msg = "{} [{} similar messages skipped]".format(msg, self._skipped)
+        self.log.log(self.level, msg, *args)
+        self._skipped = 0
+        self._last_time = time.time()
+
+
 class SlicableOrderedDict(OrderedDict):
     """Create an ordered dictionary with option to slice like a list.
 
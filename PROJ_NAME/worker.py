@@ -0,0 +1,474 @@
+# =================================================================
+# Script name: worker.py
+#
+# Description: long-lived worker that runs many PROJ_NAME jobs in
+# one interpreter, pulling job requests from a local queue
+# =================================================================
+# Note: Nothing in here uses arcpy - the job itself is passed in as a
+# callable so the queue and worker logic can be tested without mocks
+
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+log = logging.getLogger(__name__)
+
+# Last sequence number handed out by _next_sequence (see DirectoryQueue.put)
+_sequence_lock = threading.Lock()
+_last_sequence = 0
+
+
+def _next_sequence():
+    """Return a nanosecond timestamp that is strictly larger than the last one returned.
+
+    The clock on Windows only ticks every few milliseconds, so two calls can
+    see the same time; bumping ties by one keeps job order in this process.
+    """
+    global _last_sequence
+    with _sequence_lock:
+        _last_sequence = max(time.time_ns(), _last_sequence + 1)
+        return _last_sequence
+
+
+class JobRequest(object):
+    """A single checklist job, as submitted by AppWorx or a user.
+
+    Attributes
+    ----------
+    proc_id: str
+        Process ID from batch processer
+    email: str
+        Recipient email address
+    gdb_name: str
+        Geodatabase name to create/write to
+    log_level: str
+        Logging severity conformant to standard logging
+    resume: bool
+        Continue a failed run from its last checkpointed step. The checkpoints
+        are kept in the process folder, so the request must have the same
+        proc_id and email as the failed one.
+    params: dict
+        Analysis parameters (e.g. sale name); part of the result cache key
+    """
+    fields = ('proc_id', 'email', 'gdb_name', 'log_level', 'resume', 'params')
+
+    def __init__(self, proc_id, email, gdb_name, log_level='INFO', resume=False, params=None):
+        """
+        Parameters
+        ----------
+        proc_id: str
+            Process ID from batch processer
+        email: str
+            Recipient email address
+        gdb_name: str
+            Geodatabase name to create/write to
+        log_level: str, optional
+            Logging severity conformant to standard logging. Defaults to 'INFO'.
+        resume: bool, optional
+            Continue a failed run from its last checkpointed step (same proc_id
+            and email as the failed run). Defaults to False.
+        params: dict, optional
+            Analysis parameters. Defaults to none.
+        """
+        self.proc_id = str(proc_id)
+        self.email = email
+        self.gdb_name = gdb_name
+        self.log_level = log_level.upper()
+        self.resume = bool(resume)
+        self.params = dict(params or {})
+
+    def __repr__(self):
+        return "JobRequest({})".format(", ".join("{}={!r}".format(f, getattr(self, f))
+                                                 for f in self.fields))
+
+    @classmethod
+    def from_dict(cls, in_dict):
+        """Build a request from a dictionary, e.g. a parsed JSON job file.
+
+        Parameters
+        ----------
+        in_dict: dict
+            Must contain 'proc_id', 'email' and 'gdb_name'; 'log_level',
+            'resume' and 'params' are optional
+
+        Returns
+        -------
+        JobRequest
+
+        Raises
+        ------
+        ValueError
+            If a required field is missing
+        TypeError
+            If ``in_dict`` is not a dictionary, or a field has the wrong type
+        """
+        if not isinstance(in_dict, dict):
+            raise TypeError("Job request must be a JSON object, not {}".format(
+                type(in_dict).__name__))
+        missing = [f for f in cls.fields[:3] if not in_dict.get(f)]
+        if missing:
+            raise ValueError("Job request missing field(s): {}".format(", ".join(missing)))
+        bad = [f for f in ('email', 'gdb_name', 'log_level')
+               if f in in_dict and not isinstance(in_dict[f], str)]
+        if not isinstance(in_dict['proc_id'], (str, int)):
+            bad.insert(0, 'proc_id')
+        if not isinstance(in_dict.get('params') or {}, dict):
+            bad.append('params')
+        if bad:
+            raise TypeError("Job request field(s) of the wrong type: {}".format(", ".join(bad)))
+        return cls(**{f: in_dict[f] for f in cls.fields if f in in_dict})
+
+    def to_dict(self):
+        """Return the request as a plain dictionary.
+
+        Returns
+        -------
+        dict
+        """
+        return {f: getattr(self, f) for f in self.fields}
+
+
+class DirectoryQueue(object):
+    """Job queue backed by a folder of ``*.json`` files.
+
+    Each pending job is one JSON file. A job is claimed by renaming it to
+    ``*.running``, which is atomic on the same volume, so several workers can
+    share the folder without handing out the same job twice. Finished jobs are
+    renamed to ``*.done`` or ``*.failed`` so they stay around for auditing.
+    Job files are named by a zero-padded, strictly increasing sequence, so
+    they are claimed in the order they were put.
+
+    Attributes
+    ----------
+    folder: str
+        Full path to the queue folder
+    """
+
+    def __init__(self, folder):
+        """
+        Parameters
+        ----------
+        folder: str
+            Full path to the queue folder (created if it does not exist)
+        """
+        self.folder = os.path.abspath(folder)
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+
+    def put(self, request):
+        """Add a job to the queue.
+
+        Parameters
+        ----------
+        request: JobRequest
+
+        Returns
+        -------
+        str
+            Full path of the job file
+        """
+        name = "{:020d}_{}".format(_next_sequence(), uuid.uuid4().hex[:8])
+        tmp_path = os.path.join(self.folder, name + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(request.to_dict(), f)
+        job_path = os.path.join(self.folder, name + ".json")
+        os.rename(tmp_path, job_path)
+        return job_path
+
+    def claim(self):
+        """Claim the oldest pending job.
+
+        Returns
+        -------
+        tuple or None
+            (token, JobRequest), or None if the queue is empty. The token is
+            passed back to :meth:`complete`.
+        """
+        for job_path in sorted(glob.glob(os.path.join(self.folder, "*.json"))):
+            running_path = job_path + ".running"
+            try:
+                os.rename(job_path, running_path)
+            except OSError:
+                # Another worker got there first
+                continue
+            try:
+                with open(running_path) as f:
+                    request = JobRequest.from_dict(json.load(f))
+            except (ValueError, TypeError, AttributeError) as e:
+                log.error("Bad job file {}: {}".format(job_path, e))
+                os.rename(running_path, job_path + ".failed")
+                continue
+            return running_path, request
+        return None
+
+    def complete(self, token, error=None):
+        """Mark a claimed job as done (or failed, if ``error`` is given).
+
+        Parameters
+        ----------
+        token: str
+            Token returned by :meth:`claim`
+        error: str, optional
+            Error message for a failed job
+
+        Returns
+        -------
+        None
+        """
+        base = token[:-len(".running")]
+        if error is None:
+            os.rename(token, base + ".done")
+        else:
+            os.rename(token, base + ".failed")
+            with open(base + ".error", 'w') as f:
+                f.write(str(error))
+
+
+class SqliteQueue(object):
+    """Job queue backed by a SQLite table.
+
+    A new connection is opened for each call, so one queue object can be shared
+    between worker threads. Jobs are claimed inside a ``BEGIN IMMEDIATE``
+    transaction so two workers never claim the same row.
+
+    Attributes
+    ----------
+    db_path: str
+        Full path to the SQLite database
+    """
+
+    def __init__(self, db_path):
+        """
+        Parameters
+        ----------
+        db_path: str
+            Full path to the SQLite database (created if it does not exist)
+        """
+        self.db_path = os.path.abspath(db_path)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                         "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "proc_id TEXT, email TEXT, gdb_name TEXT, log_level TEXT, "
+                         "status TEXT DEFAULT 'pending', submitted REAL, "
+                         "started REAL, finished REAL, error TEXT, resume INTEGER DEFAULT 0, "
+                         "params TEXT)")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+            # Queue databases made before these columns existed
+            for column, definition in (('resume', 'INTEGER DEFAULT 0'), ('params', 'TEXT')):
+                if column not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN {} {}".format(column, definition))
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def put(self, request):
+        """Add a job to the queue.
+
+        Parameters
+        ----------
+        request: JobRequest
+
+        Returns
+        -------
+        int
+            Row id of the new job
+        """
+        conn = self._connect()
+        try:
+            cur = conn.execute("INSERT INTO jobs (proc_id, email, gdb_name, log_level, resume, "
+                               "params, submitted) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (request.proc_id, request.email, request.gdb_name,
+                                request.log_level, int(request.resume),
+                                json.dumps(request.params), time.time()))
+            return cur.lastrowid
+        finally:
+            conn.close()
+
+    def claim(self):
+        """Claim the oldest pending job.
+
+        Returns
+        -------
+        tuple or None
+            (token, JobRequest), or None if the queue is empty
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT id, proc_id, email, gdb_name, log_level, resume, params "
+                               "FROM jobs "
+                               "WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?",
+                         (time.time(), row[0]))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return row[0], JobRequest(*row[1:6], params=json.loads(row[6]) if row[6] else None)
+
+    def complete(self, token, error=None):
+        """Mark a claimed job as done (or failed, if ``error`` is given).
+
+        Parameters
+        ----------
+        token: int
+            Token returned by :meth:`claim`
+        error: str, optional
+            Error message for a failed job
+
+        Returns
+        -------
+        None
+        """
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ?",
+                         ('done' if error is None else 'failed', time.time(),
+                          None if error is None else str(error), token))
+        finally:
+            conn.close()
+
+
+def open_queue(location):
+    """Open a queue from a path: ``*.db``/``*.sqlite`` is SQLite, anything else a folder.
+
+    Parameters
+    ----------
+    location: str
+        Path to a queue folder or SQLite database
+
+    Returns
+    -------
+    DirectoryQueue or SqliteQueue
+    """
+    if os.path.splitext(location)[1].lower() in ('.db', '.sqlite', '.sqlite3'):
+        return SqliteQueue(location)
+    return DirectoryQueue(location)
+
+
+class Worker(object):
+    """Run queued jobs in a warm interpreter with a fixed number of threads.
+
+    The worker only knows how to pull requests and hand them to ``run_job``.
+    Anything expensive to start (importing arcpy, setting arcpy defaults,
+    checking out licenses) is done once by the caller before :meth:`run`.
+    ``run_job`` is expected to build its own :class:`main.SetUp` for each
+    request, so no per-job state is shared between jobs.
+
+    Example
+    -------
+    .. code-block:: python
+
+        # This code block commented because it is for example purposes only (should not be run)
+
+        # worker = Worker(open_queue('jobs.db'), run_job, concurrency=2)
+        # worker.run()
+
+    Attributes
+    ----------
+    queue: DirectoryQueue or SqliteQueue
+        Where job requests come from
+    run_job: callable
+        Called with a single JobRequest; an exception marks the job failed
+    concurrency: int
+        Maximum number of jobs running at once
+    poll_interval: float
+        Seconds to wait before checking an empty queue again
+    """
+
+    def __init__(self, queue, run_job, concurrency=1, poll_interval=5.0):
+        """
+        Parameters
+        ----------
+        queue: DirectoryQueue or SqliteQueue
+            Where job requests come from
+        run_job: callable
+            Called with a single JobRequest
+        concurrency: int, optional
+            Maximum number of jobs running at once. Defaults to 1.
+        poll_interval: float, optional
+            Seconds to wait before checking an empty queue again. Defaults to 5.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.queue = queue
+        self.run_job = run_job
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.completed = 0
+        self.failed = 0
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Ask the worker to stop after the jobs already running finish.
+
+        Returns
+        -------
+        None
+        """
+        self._stop.set()
+
+    def _run_one(self, token, request):
+        log.info("Starting job {}".format(request))
+        start = time.time()
+        try:
+            self.run_job(request)
+        except BaseException as e:
+            # SystemExit included - main-style job code may call sys.exit on failure
+            log.exception("Job {} failed: ".format(request.proc_id))
+            self.queue.complete(token, error=e)
+            return False
+        self.queue.complete(token)
+        log.info("Finished job {} in {:.1f} s".format(request.proc_id, time.time() - start))
+        return True
+
+    def run(self, max_jobs=None, stop_when_empty=False):
+        """Pull and run jobs until stopped.
+
+        Parameters
+        ----------
+        max_jobs: int, optional
+            Stop after this many jobs have been started
+        stop_when_empty: bool, optional
+            Stop once the queue is empty and all running jobs have finished
+
+        Returns
+        -------
+        tuple
+            (completed, failed) job counts
+        """
+        started = 0
+        running = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while True:
+                while (len(running) < self.concurrency and not self._stop.is_set()
+                       and (max_jobs is None or started < max_jobs)):
+                    claimed = self.queue.claim()
+                    if claimed is None:
+                        break
+                    running.add(pool.submit(self._run_one, *claimed))
+                    started += 1
+
+                no_more = (self._stop.is_set() or (max_jobs is not None and started >= max_jobs)
+                           or (stop_when_empty and len(running) < self.concurrency))
+                if not running and no_more:
+                    break
+                if running:
+                    done, running = wait(running, timeout=None if no_more else self.poll_interval,
+                                         return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future.result():
+                            self.completed += 1
+                        else:
+                            self.failed += 1
+                else:
+                    self._stop.wait(self.poll_interval)
+        return self.completed, self.failed
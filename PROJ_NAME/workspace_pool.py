@@ -0,0 +1,263 @@
+# =================================================================
+# Script name: workspace_pool.py
+#
+# Description: keep source workspace connections open and reuse
+# them across extractions
+# =================================================================
+# Note: Nothing in here uses arcpy - how a handle is opened, checked
+# and closed is passed in, so the pool can be tested against SQLite
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Named pools in this process (see shared_pool)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def shared_pool(name, opener, closer=None, health_check=None, max_idle=600, check_after=60):
+    """Return this process's pool called ``name``, making it if need be.
+
+    A named pool can be passed to steps run in other processes (see
+    :class:`steps.StepGraph`): it is pickled by name, and each process
+    unpickles it as its own pool of that name, so handles are reused by every
+    step the process runs but never shared between processes.
+
+    Parameters are as for :class:`WorkspacePool`; ``opener``, ``closer`` and
+    ``health_check`` must be picklable (module-level functions or classes).
+
+    Returns
+    -------
+    WorkspacePool
+    """
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = WorkspacePool(opener, closer, health_check, max_idle, check_after,
+                                         name=name)
+        return _pools[name]
+
+
+class WorkspacePool(object):
+    """Pool of open workspace handles, keyed by workspace path.
+
+    A handle is checked out with :meth:`connection` (or :meth:`acquire` /
+    :meth:`release`), so each handle is used by one thread at a time. Handles
+    given back are kept for reuse; one that has sat idle longer than
+    ``max_idle`` seconds is closed. A handle that has been idle for
+    ``check_after`` seconds or more is health-checked before it is handed out
+    again, and replaced if the check fails. Handles that are in constant use
+    are not checked, so a hit does not cost a round trip.
+
+    Example
+    -------
+    .. code-block:: python
+
+        # This code block commented because it is for example purposes only (should not be run)
+
+        # pool = WorkspacePool(sqlite3.connect, closer=lambda c: c.close(),
+        #                      health_check=lambda c: c.execute("SELECT 1"))
+        # with pool.connection('ropa.gpkg') as conn:
+        #     conn.execute("SELECT * FROM roads")
+        # pool.stats()
+
+    Attributes
+    ----------
+    opener: callable
+        Called with a key, returns a new handle
+    closer: callable
+        Called with a handle to close it (None if handles need no closing)
+    health_check: callable
+        Called with a handle; should raise, or return False, if it is broken
+    max_idle: float
+        Seconds an unused handle is kept open
+    check_after: float
+        Seconds idle after which a handle is health-checked before reuse
+    name: str
+        Name the pool is shared under in each process (None if not shared)
+    """
+
+    def __init__(self, opener, closer=None, health_check=None, max_idle=600, check_after=60,
+                 name=None):
+        """
+        Parameters
+        ----------
+        opener: callable
+            Called with a key, returns a new handle
+        closer: callable, optional
+            Called with a handle to close it
+        health_check: callable, optional
+            Called with a handle; should raise, or return False, if it is broken
+        max_idle: float, optional
+            Seconds an unused handle is kept open. Defaults to 600.
+        check_after: float, optional
+            Seconds idle after which a handle is health-checked. Defaults to 60.
+        name: str, optional
+            Use :func:`shared_pool` rather than setting this directly
+        """
+        self.opener = opener
+        self.closer = closer
+        self.health_check = health_check
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.name = name
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'failed_checks': 0}
+
+    def __reduce__(self):
+        if self.name is None:
+            raise TypeError("Only pools from shared_pool() can be sent to another process")
+        return shared_pool, (self.name, self.opener, self.closer, self.health_check,
+                             self.max_idle, self.check_after)
+
+    def _close(self, handle):
+        if self.closer is None:
+            return
+        try:
+            self.closer(handle)
+        except Exception as e:
+            log.warning("Error closing workspace handle: {}".format(e))
+
+    def _healthy(self, handle):
+        if self.health_check is None:
+            return True
+        try:
+            return self.health_check(handle) is not False
+        except Exception:
+            return False
+
+    def acquire(self, key):
+        """Check out a handle for ``key``, reusing an idle one if possible.
+
+        Parameters
+        ----------
+        key: str
+            Workspace path, e.g. the ROPA connection file
+
+        Returns
+        -------
+        any type
+            Handle returned by ``opener``
+        """
+        self.evict_idle()
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    self._stats['misses'] += 1
+                    break
+                handle, last_used = idle.pop()
+            if time.time() - last_used < self.check_after or self._healthy(handle):
+                with self._lock:
+                    self._stats['hits'] += 1
+                return handle
+            with self._lock:
+                self._stats['failed_checks'] += 1
+            log.info("Workspace handle for {} failed its health check - reopening".format(key))
+            self._close(handle)
+        return self.opener(key)
+
+    def release(self, key, handle, broken=False):
+        """Give a handle back to the pool.
+
+        Parameters
+        ----------
+        key: str
+            Key the handle was acquired with
+        handle: any type
+            Handle from :meth:`acquire`
+        broken: bool, optional
+            Close the handle instead of keeping it
+
+        Returns
+        -------
+        None
+        """
+        if broken:
+            self._close(handle)
+            return
+        with self._lock:
+            self._idle.setdefault(key, []).append((handle, time.time()))
+
+    @contextmanager
+    def connection(self, key):
+        """Check out a handle for the length of a ``with`` block.
+
+        If the block raises, the handle is closed rather than reused.
+        """
+        handle = self.acquire(key)
+        try:
+            yield handle
+        except Exception:
+            self.release(key, handle, broken=True)
+            raise
+        self.release(key, handle)
+
+    def evict_idle(self):
+        """Close handles that have been idle longer than ``max_idle``.
+
+        Returns
+        -------
+        int
+            Number of handles closed
+        """
+        cutoff = time.time() - self.max_idle
+        expired = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                expired.extend(handle for handle, last_used in idle if last_used < cutoff)
+                idle[:] = [(h, t) for h, t in idle if t >= cutoff]
+            self._stats['evictions'] += len(expired)
+        for handle in expired:
+            self._close(handle)
+        return len(expired)
+
+    def close(self):
+        """Close every idle handle.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            handles = [handle for idle in self._idle.values() for handle, _ in idle]
+            self._idle = {}
+        for handle in handles:
+            self._close(handle)
+
+    def stats(self):
+        """Return pool counters.
+
+        Returns
+        -------
+        dict
+            'hits', 'misses', 'evictions', 'failed_checks' and 'idle' (handles
+            currently kept open and not checked out)
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = sum(len(idle) for idle in self._idle.values())
+        return stats
+
+    def usage_since(self, before):
+        """Return how the hit/miss counters have moved since an earlier :meth:`stats`.
+
+        Counts one piece of work (e.g. one extraction) on its own, as long as
+        nothing else uses the pool at the same time.
+
+        Parameters
+        ----------
+        before: dict
+            Output of :meth:`stats`
+
+        Returns
+        -------
+        dict
+            'hits', 'misses' and 'failed_checks'
+        """
+        now = self.stats()
+        return {name: now[name] - before[name] for name in ('hits', 'misses', 'failed_checks')}
@@ -0,0 +1,85 @@
+"""
+Tests for the export.py module
+"""
+
+import csv
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    import export  # The code under test
+except ImportError:
+    import PROJ_NAME.export as export
+
+
+class TestExportTable(unittest.TestCase):
+    """
+    Tests export.export_table
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.out_base = os.path.join(self.tmp, 'roads')
+        self.columns = [('ROAD_ID', 'int'), ('NAME', 'str'), ('BUILT', 'datetime'),
+                        ('geometry_wkb', 'binary')]
+        self.rows = [(1, 'Main', datetime.datetime(2018, 9, 13, 13, 21), bytearray(b'\x01\x02')),
+                     (2, None, None, None),
+                     (3, 'Spur', datetime.datetime(2019, 1, 1), b'\xff')]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def read_csv(self):
+        with open(self.out_base + '.csv', newline='') as f:
+            return list(csv.reader(f))
+
+    def test_csv_formats_dates_and_wkb(self):
+        export.export_table(self.rows, self.columns, self.out_base, formats=('csv',))
+        self.assertEqual(self.read_csv()[:3],
+                         [['ROAD_ID', 'NAME', 'BUILT', 'geometry_wkb'],
+                          ['1', 'Main', '2018-09-13T13:21:00', '0102'],
+                          ['2', '', '', '']])
+
+    def test_rows_written_across_chunks(self):
+        count = export.export_table(iter(self.rows), self.columns, self.out_base,
+                                    formats=('csv',), chunk_size=2)
+        self.assertEqual(count, 3)
+        self.assertEqual([row[0] for row in self.read_csv()], ['ROAD_ID', '1', '2', '3'])
+
+    def test_no_temp_files_left_behind(self):
+        export.export_table(self.rows, self.columns, self.out_base, formats=('csv',))
+        self.assertEqual(os.listdir(self.tmp), ['roads.csv'])
+
+    def test_temp_files_removed_on_error(self):
+        def rows():
+            yield self.rows[0]
+            raise IOError('cursor lost its connection')
+        self.assertRaises(IOError, export.export_table, rows(), self.columns, self.out_base,
+                          formats=('csv',))
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_unknown_column_type_raises_error(self):
+        self.assertRaises(ValueError, export.export_table, self.rows,
+                          [('SHAPE', 'geometry')], self.out_base, ('csv',))
+
+    @unittest.skipIf(export.pyarrow is None, "pyarrow not installed")
+    def test_parquet_round_trips(self):
+        export.export_table(self.rows, self.columns, self.out_base,
+                            formats=('parquet',), chunk_size=2)
+        table = export.pyarrow.parquet.read_table(self.out_base + '.parquet')
+        self.assertEqual(table.column('ROAD_ID').to_pylist(), [1, 2, 3])
+        self.assertEqual(table.column('geometry_wkb').to_pylist(), [b'\x01\x02', None, b'\xff'])
+
+
+    @unittest.skipIf(export.pyarrow is None, "pyarrow not installed")
+    def test_parquet_text_column_takes_other_types(self):
+        export.export_table([(datetime.date(2018, 9, 13),), (None,)], [('SALE_DATE', 'str')],
+                            self.out_base, formats=('parquet',))
+        table = export.pyarrow.parquet.read_table(self.out_base + '.parquet')
+        self.assertEqual(table.column('SALE_DATE').to_pylist(), ['2018-09-13', None])
+
+
+if __name__ == '__main__':
+    unittest.main()
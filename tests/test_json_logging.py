@@ -0,0 +1,65 @@
+"""
+Tests for the json_logging.py module
+"""
+
+import json
+import logging
+import unittest
+try:
+    import json_logging  # The code under test
+    import steps
+except ImportError:
+    import PROJ_NAME.json_logging as json_logging
+    import PROJ_NAME.steps as steps
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+class TestJsonFormatter(unittest.TestCase):
+    """
+    Tests json_logging.JsonFormatter with json_logging.JobContextFilter
+    """
+
+    def setUp(self):
+        self.handler = ListHandler()
+        self.handler.addFilter(json_logging.JobContextFilter('kitty_12'))
+        self.handler.setFormatter(json_logging.JsonFormatter())
+        self.log = logging.getLogger('test_json_logging')
+        self.log.propagate = False
+        self.log.setLevel(logging.INFO)
+        self.log.addHandler(self.handler)
+
+    def tearDown(self):
+        self.log.removeHandler(self.handler)
+
+    def test_fields_written_as_json(self):
+        self.log.info("Clipped %s roads", 12, extra={'step': 'roads'})
+        entry = json.loads(self.handler.lines[0])
+        self.assertEqual((entry['job_id'], entry['step'], entry['level'], entry['message']),
+                         ('kitty_12', 'roads', 'INFO', 'Clipped 12 roads'))
+
+    def test_step_taken_from_running_step(self):
+        graph = steps.StepGraph(log=self.log)
+        graph.add('roads', lambda: self.log.info("inside"))
+        graph.run()
+        inside = [json.loads(line) for line in self.handler.lines
+                  if json.loads(line)['message'] == 'inside']
+        self.assertEqual(inside[0]['step'], 'roads')
+
+    def test_exception_included(self):
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            self.log.exception("Fatal error")
+        self.assertIn('ZeroDivisionError', json.loads(self.handler.lines[0])['exception'])
+
+
+if __name__ == '__main__':
+    unittest.main()
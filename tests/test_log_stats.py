@@ -0,0 +1,86 @@
+"""
+Tests for the log_stats.py module
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    import log_stats  # The code under test
+except ImportError:
+    import PROJ_NAME.log_stats as log_stats
+
+LOG_TEXT = """\
+10/01/2018 08:00:00 | PROJ_NAME.kitty_12 [Line 150] | INFO: Made new work folder at: C:\\temp
+10/01/2018 08:00:01 | PROJ_NAME.kitty_12 [Line 200] | INFO: Step roads started
+10/01/2018 08:00:31 | PROJ_NAME.kitty_12 [Line 210] | INFO: Step roads finished in {roads} s
+10/01/2018 08:00:40 | PROJ_NAME.kitty_12 [Line 210] | WARNING: Soils layer empty
+10/01/2018 08:01:00 | PROJ_NAME.kitty_12 [Line 380] | ERROR: Fatal error in job kitty_12:
+Traceback (most recent call last):
+ZeroDivisionError: division by zero
+10/01/2018 08:01:30 | PROJ_NAME.kitty_12 [Line 210] | INFO: Step road_miles finished in 2.50 s
+"""
+
+
+class TestSummarizeLog(unittest.TestCase):
+    """
+    Tests log_stats.summarize_log and log_stats.summarize_logs
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write_log(self, name, roads='30.00'):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(LOG_TEXT.format(roads=roads))
+        return path
+
+    def test_counts_and_step_durations_parsed(self):
+        run = log_stats.summarize_log(self.write_log('PROJ_NAME_1.log'))
+        self.assertEqual((run['errors'], run['warnings'], run['duration_s']), (1, 1, 90.0))
+        self.assertEqual(dict(run['steps']), {'roads': 30.0, 'road_miles': 2.5})
+
+    def test_json_log_parsed_like_text_log(self):
+        path = os.path.join(self.tmp, 'PROJ_NAME_json.log')
+        with open(path, 'w') as f:
+            f.write('{"time": "10/01/2018 08:00:00", "level": "INFO", "message": "Started"}\n'
+                    '{"time": "10/01/2018 08:00:30", "level": "INFO", "step": "roads", '
+                    '"message": "Step roads finished in 30.00 s"}\n'
+                    '{"time": "10/01/2018 08:01:00", "level": "ERROR", "message": "Oops"}\n')
+        run = log_stats.summarize_log(path)
+        self.assertEqual((run['errors'], run['duration_s'], dict(run['steps'])),
+                         (1, 60.0, {'roads': 30.0}))
+
+    def test_empty_log_returns_empty_run(self):
+        path = os.path.join(self.tmp, 'PROJ_NAME_empty.log')
+        open(path, 'w').close()
+        self.assertIsNone(log_stats.summarize_log(path)['start'])
+
+    def test_parallel_matches_serial(self):
+        paths = [self.write_log('PROJ_NAME_{}.log'.format(i)) for i in range(3)]
+        self.assertEqual(log_stats.summarize_logs(paths, processes=2),
+                         log_stats.summarize_logs(paths, processes=1))
+
+
+class TestStepTrends(unittest.TestCase):
+    """
+    Tests log_stats.step_trends
+    """
+
+    def test_slower_recent_runs_give_positive_trend(self):
+        runs = [{'steps': {'roads': seconds}} for seconds in (10, 10, 20, 20)]
+        row = log_stats.step_trends(runs, recent=2)[0]
+        self.assertEqual((row['runs'], row['median_s'], row['trend_pct']), (4, 15.0, 100.0))
+
+    def test_too_few_runs_have_no_trend(self):
+        runs = [{'steps': {'roads': 10}}]
+        self.assertIsNone(log_stats.step_trends(runs)[0]['trend_pct'])
+
+
+if __name__ == '__main__':
+    unittest.main()
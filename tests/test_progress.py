@@ -0,0 +1,104 @@
+"""
+Tests for the progress.py module
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    import progress  # The code under test
+    import steps
+except ImportError:
+    import PROJ_NAME.progress as progress
+    import PROJ_NAME.steps as steps
+
+
+def count_in_batches(total):
+    for _ in range(total // 100):
+        steps.count_rows(100)
+
+
+class TestProgressReporter(unittest.TestCase):
+    """
+    Tests progress.ProgressReporter
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'status.json')
+        self.reporter = progress.ProgressReporter(self.path, job_id='kitty_12', min_interval=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def read(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+    def test_rows_and_eta_reported(self):
+        step = self.reporter.start_step('roads', total_rows=100, check_every=10)
+        for _ in range(50):
+            step.advance()
+        status = self.read()['running']['roads']
+        self.assertEqual((status['rows'], status['total_rows']), (50, 100))
+        self.assertIsNotNone(status['eta_s'])
+
+    def test_writes_throttled(self):
+        self.reporter.min_interval = 3600
+        step = self.reporter.start_step('roads', check_every=1)
+        for _ in range(5):
+            step.advance()
+        self.assertEqual(self.read()['running']['roads']['rows'], 0)
+
+    def test_finished_job_has_no_running_steps(self):
+        self.reporter.start_step('roads')
+        self.reporter.finish_step('roads')
+        self.reporter.finish()
+        status = self.read()
+        self.assertEqual((status['state'], status['steps_done'], status['running']),
+                         ('finished', 1, {}))
+
+    def test_step_graph_updates_status(self):
+        graph = steps.StepGraph(progress=self.reporter)
+        graph.add('roads', lambda: self.reporter.get(steps.current_step()).advance(5))
+        graph.add('streams', steps.count_rows, n=2500)
+        graph.run()
+        status = self.read()
+        self.assertEqual((status['steps_done'], status['steps_total']), (2, 2))
+        self.assertEqual({name: step['rows'] for name, step in status['finished'].items()},
+                         {'roads': 5, 'streams': 2500})
+
+    def test_rows_counted_in_step_processes(self):
+        graph = steps.StepGraph(progress=self.reporter)
+        graph.add('roads', count_in_batches, total=2500)
+        graph.run(max_workers=1, use_processes=True)
+        self.assertEqual(self.read()['finished']['roads']['rows'], 2500)
+
+
+    def test_failed_step_counted_separately(self):
+        graph = steps.StepGraph(progress=self.reporter)
+        graph.add('roads', lambda: 1 / 0)
+        graph.add('streams', lambda: None)
+        self.assertRaises(ZeroDivisionError, graph.run, max_workers=1)
+        status = self.read()
+        self.assertEqual((status['steps_done'], status['steps_failed'], status['failed_steps']),
+                         (1, 1, ['roads']))
+
+    def test_declared_total_rows_reported(self):
+        graph = steps.StepGraph(progress=self.reporter)
+        totals = []
+        graph.add('roads', lambda: totals.append(self.reporter.get('roads').total_rows),
+                  total_rows=80000)
+        graph.run()
+        self.assertEqual(totals, [80000])
+
+    def test_write_error_does_not_raise(self):
+        self.reporter.path = os.path.join(self.tmp, 'missing_folder', 'status.json')
+        with self.assertLogs(progress.log, 'WARNING'):
+            self.assertFalse(self.reporter.write(force=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
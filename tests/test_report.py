@@ -0,0 +1,70 @@
+"""
+Tests for the report.py module
+"""
+
+import datetime
+import io
+import unittest
+try:
+    import report  # The code under test
+except ImportError:
+    import PROJ_NAME.report as report
+
+
+class TestReportRenderer(unittest.TestCase):
+    """
+    Tests report.ReportRenderer
+    """
+
+    def setUp(self):
+        self.rows = [(1, '<Main>', datetime.datetime(2018, 9, 13)),
+                     (2, 'Spur & Co', None)]
+        self.renderer = report.ReportRenderer(['ROAD_ID', 'NAME', 'BUILT'], date_columns=['BUILT'],
+                                              bracket_columns=['NAME'],
+                                              text_row="Road {ROAD_ID:>3}: {NAME} ({BUILT})")
+
+    def render(self, output, **kwargs):
+        out = io.StringIO()
+        count = self.renderer.render(iter(self.rows), out, output=output, **kwargs)
+        return count, out.getvalue()
+
+    def test_text_uses_template_and_cleans_columns(self):
+        self.assertEqual(self.render('text', chunk_size=1),
+                         (2, "Road   1: Main (09/13/2018)\nRoad   2: Spur & Co ()\n"))
+
+    def test_html_escapes_values(self):
+        count, text = self.render('html')
+        self.assertIn("<tr><td>2</td><td>Spur &amp; Co</td><td></td></tr>", text)
+        self.assertTrue(text.endswith("</table>\n"))
+
+    def test_csv_has_header(self):
+        count, text = self.render('csv')
+        self.assertEqual(text.splitlines(), ['ROAD_ID,NAME,BUILT', '1,Main,09/13/2018', '2,Spur & Co,'])
+
+    def test_default_text_row_joins_all_columns(self):
+        renderer = report.ReportRenderer(['A', 'B'])
+        out = io.StringIO()
+        renderer.render([('x', 'y')], out)
+        self.assertEqual(out.getvalue(), "x | y\n")
+
+    def test_null_skips_format_spec(self):
+        renderer = report.ReportRenderer(['UNIT', 'ACRES'], text_row="{UNIT}: {ACRES:.1f} ac")
+        out = io.StringIO()
+        renderer.render([('A', 12.345), ('B', None)], out)
+        self.assertEqual(out.getvalue(), "A: 12.3 ac\nB:  ac\n")
+
+    def test_brackets_only_removed_from_strings(self):
+        renderer = report.ReportRenderer(['CODE'], bracket_columns=['CODE'])
+        out = io.StringIO()
+        renderer.render([(5,), ('<7>',)], out)
+        self.assertEqual(out.getvalue(), "5\n7\n")
+
+    def test_unknown_template_column_raises_error(self):
+        self.assertRaises(ValueError, report.ReportRenderer, ['A'], text_row="{B}")
+
+    def test_unknown_output_raises_error(self):
+        self.assertRaises(ValueError, self.render, 'pdf')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Tests for the result_cache.py module
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+try:
+    import result_cache  # The code under test
+except ImportError:
+    import PROJ_NAME.result_cache as result_cache
+
+
+class TestCacheKey(unittest.TestCase):
+    """
+    Tests result_cache.cache_key
+    """
+
+    def test_formatting_differences_ignored(self):
+        self.assertEqual(result_cache.cache_key('Checklist', {'Sale_Name': ' Kitty '}),
+                         result_cache.cache_key('checklist', {'sale_name': 'Kitty'}))
+
+    def test_no_key_without_params(self):
+        self.assertIsNone(result_cache.cache_key('checklist'))
+        self.assertIsNone(result_cache.cache_key('checklist', {}))
+
+    def test_no_key_without_required_params(self):
+        self.assertIsNone(result_cache.cache_key('checklist', {'log': 'x'}, required=['sale_name']))
+
+    def test_source_state_changes_key(self):
+        self.assertNotEqual(
+            result_cache.cache_key('checklist', {'sale_name': 'Kitty'}, {'ROPA.ROADS': [10, 'a']}),
+            result_cache.cache_key('checklist', {'sale_name': 'Kitty'}, {'ROPA.ROADS': [11, 'a']}))
+
+    def test_different_params_give_different_keys(self):
+        self.assertNotEqual(result_cache.cache_key('checklist', {'sale_name': 'Kitty'}),
+                            result_cache.cache_key('checklist', {'sale_name': 'Parrot'}))
+
+
+class TestResultCache(unittest.TestCase):
+    """
+    Tests result_cache.ResultCache
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.job_folder = os.path.join(self.tmp, 'kitty_12')
+        os.makedirs(os.path.join(self.job_folder, 'checklist.gdb'))
+        with open(os.path.join(self.job_folder, 'checklist.gdb', 'a00000001.gdbtable'), 'w') as f:
+            f.write('roads')
+        self.cache = result_cache.ResultCache(os.path.join(self.tmp, 'cache'), max_entries=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_restore_copies_cached_outputs(self):
+        self.cache.put('abc', self.job_folder, ['checklist.gdb', 'missing.csv'])
+        new_folder = os.path.join(self.tmp, 'parrot_13')
+        os.makedirs(os.path.join(new_folder, 'checklist.gdb'))
+        self.assertTrue(self.cache.restore('abc', new_folder))
+        self.assertEqual(os.listdir(os.path.join(new_folder, 'checklist.gdb')), ['a00000001.gdbtable'])
+
+    def test_empty_params_never_hit(self):
+        key = result_cache.cache_key('checklist', {})
+        self.assertIsNone(self.cache.put(key, self.job_folder, ['checklist.gdb']))
+        self.assertFalse(self.cache.restore(key, self.job_folder))
+        self.assertEqual(os.listdir(self.cache.folder), ['cache.db'])
+
+    def test_miss_returns_none(self):
+        self.assertIsNone(self.cache.get('abc'))
+        self.assertFalse(self.cache.restore('abc', self.job_folder))
+
+    def test_expired_entry_evicted(self):
+        self.cache.ttl = 0
+        self.cache.put('abc', self.job_folder, ['checklist.gdb'])
+        time.sleep(0.01)
+        self.assertIsNone(self.cache.get('abc'))
+        self.assertFalse(os.path.exists(os.path.join(self.cache.folder, 'abc')))
+
+    def test_least_recently_used_evicted_over_max_entries(self):
+        for key in ('a', 'b'):
+            self.cache.put(key, self.job_folder, ['checklist.gdb'])
+            time.sleep(0.01)
+        self.cache.get('a')
+        self.cache.put('c', self.job_folder, ['checklist.gdb'])
+        self.assertEqual([k for k in 'abc' if self.cache.get(k)], ['a', 'c'])
+
+    def test_max_bytes_respected(self):
+        self.cache.max_bytes = 5
+        self.cache.put('a', self.job_folder, ['checklist.gdb'])
+        self.cache.put('b', self.job_folder, ['checklist.gdb'])
+        self.assertEqual([k for k in 'ab' if self.cache.get(k)], ['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,275 @@
+"""
+Tests for the steps.py module
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import steps  # The code under test
+except ImportError:
+    import PROJ_NAME.steps as steps
+
+
+def sleep_for(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def set_env():
+    os.environ['STEPS_TEST_INITIALIZED'] = 'yes'
+
+
+def read_env():
+    return os.getpid(), os.environ.get('STEPS_TEST_INITIALIZED')
+
+
+class TestStepGraph(unittest.TestCase):
+    """
+    Tests steps.StepGraph
+    """
+
+    def setUp(self):
+        self.graph = steps.StepGraph()
+
+    def test_circular_dependency_raises_error(self):
+        self.graph.add('a', sleep_for, inputs=['b.fc'], outputs=['a.fc'], seconds=0)
+        self.graph.add('b', sleep_for, inputs=['a.fc'], outputs=['b.fc'], seconds=0)
+        self.assertRaises(steps.StepGraphError, self.graph.run)
+
+    def test_same_output_twice_raises_error(self):
+        self.graph.add('a', sleep_for, outputs=['a.fc'], seconds=0)
+        self.graph.add('b', sleep_for, outputs=['a.fc'], seconds=0)
+        self.assertRaises(steps.StepGraphError, self.graph.dependencies)
+
+    def test_dependent_step_waits_for_input(self):
+        order = []
+        self.graph.add('summary', lambda x: order.append(x), inputs=['roads.fc'], x='summary')
+        self.graph.add('roads', lambda x: time.sleep(0.05) or order.append(x),
+                       outputs=['roads.fc'], x='roads')
+        self.graph.run()
+        self.assertEqual(order, ['roads', 'summary'])
+
+    def test_independent_steps_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+        self.graph.add('roads', barrier.wait, outputs=['roads.fc'])
+        self.graph.add('streams', barrier.wait, outputs=['streams.fc'])
+        self.graph.run(max_workers=2)
+
+    def test_failed_step_stops_dependents_and_raises(self):
+        ran = []
+        self.graph.add('roads', lambda: 1 / 0, outputs=['roads.fc'])
+        self.graph.add('summary', lambda x: ran.append(x), inputs=['roads.fc'], x='summary')
+        self.assertRaises(ZeroDivisionError, self.graph.run)
+        self.assertEqual(ran, [])
+
+    def test_processes_run_initializer_first(self):
+        self.graph.add('roads', read_env, outputs=['roads.fc'])
+        results = self.graph.run(max_workers=1, use_processes=True, initializer=set_env)
+        pid, initialized = results['roads']
+        self.assertNotEqual(pid, os.getpid())
+        self.assertEqual(initialized, 'yes')
+
+    def test_sources_are_inputs_no_step_writes(self):
+        self.graph.add('roads', sleep_for, inputs=['ropa.roads', 'sale.fc'], outputs=['roads.fc'],
+                       seconds=0)
+        self.graph.add('summary', sleep_for, inputs=['roads.fc', 'sale.fc'], seconds=0)
+        self.assertEqual(self.graph.sources(), ['ropa.roads', 'sale.fc'])
+
+    def test_given_executor_reused_and_left_running(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            for _ in range(2):
+                graph = steps.StepGraph()
+                graph.add('roads', threading.get_ident, outputs=['roads.fc'])
+                results = graph.run(executor=executor)
+            self.assertEqual(executor.submit(threading.get_ident).result(), results['roads'])
+
+    def test_critical_path_is_longest_chain(self):
+        self.graph.add('roads', sleep_for, outputs=['roads.fc'], seconds=0.05)
+        self.graph.add('road_miles', sleep_for, inputs=['roads.fc'], seconds=0.05)
+        self.graph.add('streams', sleep_for, outputs=['streams.fc'], seconds=0.02)
+        self.assertEqual(self.graph.run()['roads'], 0.05)
+        path, length = self.graph.critical_path()
+        self.assertEqual(path, ['roads', 'road_miles'])
+        self.assertGreaterEqual(length, 0.1)
+
+
+class TestFingerprints(unittest.TestCase):
+    """
+    Tests skipping unchanged steps with steps.FingerprintStore
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp, 'source.txt')
+        with open(self.source, 'w') as f:
+            f.write('roads')
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, out_path, where_clause):
+        self.calls.append(os.path.basename(out_path))
+        with open(out_path, 'w') as f:
+            f.write(where_clause)
+
+    def run_graph(self, where_clause="TYPE = 'A'"):
+        store = steps.FingerprintStore(os.path.join(self.tmp, 'fingerprints.json'))
+        graph = steps.StepGraph(store=store)
+        extract = os.path.join(self.tmp, 'extract.txt')
+        summary = os.path.join(self.tmp, 'summary.txt')
+        other = os.path.join(self.tmp, 'other.txt')
+        graph.add('extract', self.write, inputs=[self.source], outputs=[extract],
+                  out_path=extract, where_clause=where_clause)
+        graph.add('summary', self.write, inputs=[extract], outputs=[summary],
+                  out_path=summary, where_clause='')
+        graph.add('other', self.write, outputs=[other], out_path=other, where_clause='')
+        graph.run()
+        return graph
+
+    def test_unchanged_rerun_skips_every_step(self):
+        self.run_graph()
+        self.calls = []
+        graph = self.run_graph()
+        self.assertEqual(self.calls, [])
+        self.assertTrue(all(step.skipped for step in graph.steps))
+
+    def test_changed_parameter_reruns_step_and_downstream_only(self):
+        self.run_graph()
+        self.calls = []
+        self.run_graph(where_clause="TYPE = 'B'")
+        self.assertEqual(self.calls, ['extract.txt', 'summary.txt'])
+
+    def test_source_state_read_once_per_source(self):
+        checked = []
+
+        def source_state(path):
+            checked.append(path)
+            return steps.file_state(path)
+        graph = steps.StepGraph(store=steps.FingerprintStore(os.path.join(self.tmp, 'fp.json')),
+                                source_state=source_state)
+        for name in ('roads', 'streams'):
+            out_path = os.path.join(self.tmp, name + '.txt')
+            graph.add(name, self.write, inputs=[self.source], outputs=[out_path],
+                      out_path=out_path, where_clause='')
+        self.assertEqual(graph.source_states(), {self.source: steps.file_state(self.source)})
+        graph.run()
+        self.assertEqual(checked, [self.source])
+
+    def test_object_argument_must_be_unhashed(self):
+        graph = steps.StepGraph()
+        self.assertRaises(steps.StepGraphError, graph.add, 'extract', self.write, pool=object())
+
+    def test_unhashed_argument_does_not_change_fingerprint(self):
+        out_path = os.path.join(self.tmp, 'extract.txt')
+        for _ in range(2):
+            store = steps.FingerprintStore(os.path.join(self.tmp, 'fingerprints.json'))
+            graph = steps.StepGraph(store=store)
+            graph.add('extract', lambda out_path, pool: self.write(out_path, ''),
+                      inputs=[self.source], outputs=[out_path], unhashed=['pool'],
+                      out_path=out_path, pool=object())
+            graph.run()
+        self.assertEqual(self.calls, ['extract.txt'])
+
+    def test_missing_output_reruns_step(self):
+        self.run_graph()
+        os.remove(os.path.join(self.tmp, 'other.txt'))
+        self.calls = []
+        self.run_graph()
+        self.assertEqual(self.calls, ['other.txt'])
+
+
+class TestCheckpoints(unittest.TestCase):
+    """
+    Tests resuming a failed run with steps.CheckpointLog
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.tmp, 'checkpoints.jsonl')
+        self.calls = []
+        self.fail_summary = True
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def extract(self, out_path):
+        self.calls.append('extract')
+        open(out_path, 'w').close()
+
+    def summary(self):
+        self.calls.append('summary')
+        if self.fail_summary:
+            raise RuntimeError('share went away')
+
+    def run_graph(self, resume):
+        graph = steps.StepGraph(checkpoint=steps.CheckpointLog(self.checkpoint_path))
+        extract = os.path.join(self.tmp, 'extract.txt')
+        graph.add('extract', self.extract, outputs=[extract], out_path=extract)
+        graph.add('summary', self.summary, inputs=[extract])
+        graph.run(resume=resume)
+
+    def test_resume_continues_after_last_completed_step(self):
+        self.assertRaises(RuntimeError, self.run_graph, False)
+        self.fail_summary = False
+        self.calls = []
+        self.run_graph(resume=True)
+        self.assertEqual(self.calls, ['summary'])
+
+    def test_fresh_run_clears_checkpoints(self):
+        self.assertRaises(RuntimeError, self.run_graph, False)
+        self.fail_summary = False
+        self.calls = []
+        self.run_graph(resume=False)
+        self.assertEqual(self.calls, ['extract', 'summary'])
+
+    def test_resume_ignores_unhashed_argument(self):
+        def run_graph(resume):
+            graph = steps.StepGraph(checkpoint=steps.CheckpointLog(self.checkpoint_path))
+            extract = os.path.join(self.tmp, 'extract.txt')
+            graph.add('extract', lambda out_path, pool: self.extract(out_path), outputs=[extract],
+                      unhashed=['pool'], out_path=extract, pool=object())
+            graph.add('summary', self.summary, inputs=[extract])
+            graph.run(resume=resume)
+        self.assertRaises(RuntimeError, run_graph, False)
+        self.fail_summary = False
+        self.calls = []
+        run_graph(resume=True)
+        self.assertEqual(self.calls, ['summary'])
+
+    def test_resume_does_not_read_sources_of_checkpointed_steps(self):
+        source = os.path.join(self.tmp, 'source.txt')
+        open(source, 'w').close()
+        checked = []
+
+        def run_graph(resume):
+            def source_state(path):
+                checked.append(path)
+                return steps.file_state(path)
+            graph = steps.StepGraph(store=steps.FingerprintStore(os.path.join(self.tmp, 'fp.json')),
+                                    source_state=source_state,
+                                    checkpoint=steps.CheckpointLog(self.checkpoint_path))
+            extract = os.path.join(self.tmp, 'extract.txt')
+            graph.add('extract', self.extract, inputs=[source], outputs=[extract], out_path=extract)
+            graph.add('summary', self.summary, inputs=[extract])
+            graph.run(resume=resume)
+        self.assertRaises(RuntimeError, run_graph, False)
+        self.fail_summary = False
+        checked[:] = []
+        self.calls = []
+        run_graph(resume=True)
+        self.assertEqual((self.calls, checked), (['summary'], []))
+
+    def test_truncated_last_line_ignored(self):
+        with open(self.checkpoint_path, 'w') as f:
+            f.write('{"step": "extract", "params": "abc", "finished": 1}\n{"step": "summ')
+        self.assertEqual(steps.CheckpointLog(self.checkpoint_path).completed, {'extract': 'abc'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,7 @@ a Python-y version of Roy Osherove's suggestion:
 http://osherove.com/blog/2005/4/3/naming-standards-for-unit-tests.html
 """
 
+import logging
 import unittest
 try:
     import util  # The code under test
@@ -129,5 +130,30 @@ class TestCheckCorporateTechniques(unittest.TestCase):
         self.assertEqual(util.check_corporate_techniques({'CLEAR_CUT'}), None)
 
 
+class TestSampledLog(unittest.TestCase):
+    """
+    Tests util.SampledLog
+    """
+
+    def setUp(self):
+        self.log = logging.getLogger('test_sampled_log')
+        self.log.setLevel(logging.DEBUG)
+
+    def test_first_and_every_nth_message_logged(self):
+        sampled = util.SampledLog(self.log, every=3)
+        with self.assertLogs(self.log, logging.DEBUG) as logged:
+            for i in range(1, 8):
+                sampled.emit("Record %s", i)
+        self.assertEqual([r.getMessage() for r in logged.records],
+                         ['Record 1', 'Record 3 [1 similar messages skipped]',
+                          'Record 6 [2 similar messages skipped]'])
+
+    def test_disabled_level_logs_nothing(self):
+        self.log.setLevel(logging.INFO)
+        sampled = util.SampledLog(self.log, every=1)
+        sampled.emit("Record %s", 1)
+        self.assertEqual(sampled.count, 0)
+
+
 if __name__ == '__main__':
     unittest.main()
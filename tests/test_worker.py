@@ -0,0 +1,141 @@
+"""
+Tests for the worker.py module
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+try:
+    import worker  # The code under test
+except ImportError:
+    import PROJ_NAME.worker as worker
+
+
+class TestJobRequest(unittest.TestCase):
+    """
+    Tests worker.JobRequest
+    """
+
+    def test_missing_field_raises_error(self):
+        self.assertRaises(ValueError, worker.JobRequest.from_dict,
+                          {'proc_id': '12', 'email': 'a@b.com'})
+
+    def test_wrong_types_raise_error(self):
+        self.assertRaises(TypeError, worker.JobRequest.from_dict, ['x'])
+        self.assertRaises(TypeError, worker.JobRequest.from_dict,
+                          {'proc_id': '12', 'email': 'a@b.com', 'gdb_name': 'gdb',
+                           'log_level': None})
+
+    def test_round_trips_through_dict(self):
+        request = worker.JobRequest('12', 'a@b.com', 'checklist', 'debug')
+        self.assertEqual(worker.JobRequest.from_dict(request.to_dict()).to_dict(),
+                         {'proc_id': '12', 'email': 'a@b.com', 'gdb_name': 'checklist',
+                          'log_level': 'DEBUG', 'resume': False, 'params': {}})
+
+
+class QueueTests(object):
+    """
+    Tests shared by both queue types
+    """
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_empty_queue_returns_none(self):
+        self.assertIsNone(self.queue.claim())
+
+    def test_jobs_claimed_oldest_first_and_only_once(self):
+        for proc_id in ('1', '2'):
+            self.queue.put(worker.JobRequest(proc_id, 'a@b.com', 'gdb'))
+        first = self.queue.claim()
+        second = self.queue.claim()
+        self.assertEqual([first[1].proc_id, second[1].proc_id], ['1', '2'])
+        self.assertIsNone(self.queue.claim())
+
+    def test_many_jobs_claimed_in_order(self):
+        for proc_id in range(50):
+            self.queue.put(worker.JobRequest(proc_id, 'a@b.com', 'gdb'))
+        claimed = [self.queue.claim()[1].proc_id for _ in range(50)]
+        self.assertEqual(claimed, [str(i) for i in range(50)])
+
+    def test_resume_flag_kept(self):
+        self.queue.put(worker.JobRequest('1', 'a@b.com', 'gdb', resume=True))
+        self.assertTrue(self.queue.claim()[1].resume)
+
+    def test_params_kept(self):
+        self.queue.put(worker.JobRequest('1', 'a@b.com', 'gdb', params={'sale_name': 'Kitty'}))
+        self.assertEqual(self.queue.claim()[1].params, {'sale_name': 'Kitty'})
+
+
+class TestDirectoryQueue(QueueTests, unittest.TestCase):
+    """
+    Tests worker.DirectoryQueue
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.queue = worker.DirectoryQueue(os.path.join(self.tmp, 'jobs'))
+
+    def test_failed_job_writes_error_file(self):
+        self.queue.put(worker.JobRequest('1', 'a@b.com', 'gdb'))
+        token, _ = self.queue.claim()
+        self.queue.complete(token, error='kaboom')
+        names = sorted(os.listdir(self.queue.folder))
+        self.assertEqual([os.path.splitext(n)[1] for n in names], ['.error', '.failed'])
+
+
+    def test_bad_job_files_failed_not_left_running(self):
+        for name, text in (('1.json', '["x"]'), ('2.json', '{"proc_id": "1", "email": "a@b.com", '
+                                                          '"gdb_name": "gdb", "log_level": null}')):
+            with open(os.path.join(self.queue.folder, name), 'w') as f:
+                f.write(text)
+        self.assertIsNone(self.queue.claim())
+        self.assertEqual(sorted(os.listdir(self.queue.folder)), ['1.json.failed', '2.json.failed'])
+
+
+class TestSqliteQueue(QueueTests, unittest.TestCase):
+    """
+    Tests worker.SqliteQueue
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.queue = worker.open_queue(os.path.join(self.tmp, 'jobs.db'))
+
+
+class TestWorker(unittest.TestCase):
+    """
+    Tests worker.Worker
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.queue = worker.SqliteQueue(os.path.join(self.tmp, 'jobs.db'))
+        for proc_id in range(6):
+            self.queue.put(worker.JobRequest(proc_id, 'a@b.com', 'gdb'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_failing_job_does_not_stop_worker(self):
+        def run_job(request):
+            if request.proc_id == '3':
+                raise RuntimeError('bad job')
+        job_worker = worker.Worker(self.queue, run_job, concurrency=2, poll_interval=0.01)
+        self.assertEqual(job_worker.run(stop_when_empty=True), (5, 1))
+
+    def test_jobs_run_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+        job_worker = worker.Worker(self.queue, lambda request: barrier.wait(),
+                                   concurrency=3, poll_interval=0.01)
+        self.assertEqual(job_worker.run(stop_when_empty=True), (6, 0))
+
+    def test_max_jobs_respected(self):
+        job_worker = worker.Worker(self.queue, lambda request: None, poll_interval=0.01)
+        self.assertEqual(job_worker.run(max_jobs=4), (4, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+Tests for the workspace_pool.py module
+
+A SQLite database stands in for the ROPA SDE workspace.
+"""
+
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+try:
+    import workspace_pool  # The code under test
+except ImportError:
+    import PROJ_NAME.workspace_pool as workspace_pool
+
+
+def close_connection(conn):
+    conn.close()
+
+
+class TestWorkspacePool(unittest.TestCase):
+    """
+    Tests workspace_pool.WorkspacePool
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.ropa = os.path.join(self.tmp, 'ropa.gpkg')
+        conn = sqlite3.connect(self.ropa)
+        conn.execute("CREATE TABLE roads (road_id INTEGER)")
+        conn.execute("INSERT INTO roads VALUES (1)")
+        conn.commit()
+        conn.close()
+        self.opened = []
+        self.pool = workspace_pool.WorkspacePool(self.open, closer=lambda c: c.close(),
+                                                 health_check=lambda c: c.execute("SELECT 1"))
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.tmp)
+
+    def open(self, path):
+        conn = sqlite3.connect(path)
+        self.opened.append(conn)
+        return conn
+
+    def test_handle_reused_across_extractions(self):
+        for _ in range(3):
+            with self.pool.connection(self.ropa) as conn:
+                self.assertEqual(conn.execute("SELECT road_id FROM roads").fetchall(), [(1,)])
+        self.assertEqual(len(self.opened), 1)
+        stats = self.pool.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['idle']), (2, 1, 1))
+
+    def test_broken_handle_replaced_after_health_check(self):
+        self.pool.check_after = 0
+        with self.pool.connection(self.ropa) as conn:
+            pass
+        conn.close()
+        with self.pool.connection(self.ropa) as conn:
+            conn.execute("SELECT 1")
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(self.pool.stats()['failed_checks'], 1)
+
+    def test_error_in_block_discards_handle(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            with self.pool.connection(self.ropa) as conn:
+                conn.execute("SELECT * FROM no_such_table")
+        self.assertEqual(self.pool.stats()['idle'], 0)
+
+    def test_idle_handles_evicted(self):
+        self.pool.max_idle = 0
+        with self.pool.connection(self.ropa):
+            pass
+        time.sleep(0.01)
+        self.assertEqual(self.pool.evict_idle(), 1)
+        self.assertEqual(self.pool.stats()['evictions'], 1)
+
+    def test_concurrent_checkouts_get_separate_handles(self):
+        first = self.pool.acquire(self.ropa)
+        second = self.pool.acquire(self.ropa)
+        self.assertIsNot(first, second)
+        self.pool.release(self.ropa, first)
+        self.pool.release(self.ropa, second)
+        self.assertEqual(self.pool.stats()['idle'], 2)
+
+
+    def test_usage_since_counts_one_extraction(self):
+        with self.pool.connection(self.ropa):
+            pass
+        before = self.pool.stats()
+        with self.pool.connection(self.ropa):
+            pass
+        self.assertEqual(self.pool.usage_since(before), {'hits': 1, 'misses': 0, 'failed_checks': 0})
+
+    def test_unshared_pool_cannot_be_pickled(self):
+        self.assertRaises(TypeError, pickle.dumps, self.pool)
+
+    def test_shared_pool_unpickles_as_process_pool(self):
+        pool = workspace_pool.shared_pool('test_ropa', sqlite3.connect, closer=close_connection)
+        try:
+            self.assertIs(pickle.loads(pickle.dumps(pool)), pool)
+            self.assertIs(workspace_pool.shared_pool('test_ropa', sqlite3.connect), pool)
+        finally:
+            pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()